@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+import random
+import sys
+import time
+from typing import Callable, List
+
+from part2 import TABLE_SIZE, fuel_for_mass, fuel_table, total_fuel
+
+
+def timed(name: str, fn: Callable[[], int]) -> int:
+    start = time.perf_counter()
+    result = fn()
+    print('{:<24} {:8.3f}s'.format(name, time.perf_counter() - start))
+    return result
+
+
+def main() -> int:
+    """Compares part 2's fuel recursion with the table, on random masses."""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 7
+    rng = random.Random(2019)
+    # The same range as the masses in the input.
+    masses: List[int] = [rng.randrange(50000, 150000) for _ in range(count)]
+
+    expected = timed('recursion', lambda: sum(map(fuel_for_mass, masses)))
+    for size in [TABLE_SIZE >> 4, TABLE_SIZE, TABLE_SIZE << 2]:
+        table = fuel_table(size)
+        result = timed('table of {}'.format(size),
+                       lambda: sum(total_fuel(mass, table) for mass in masses))
+        assert result == expected
+
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
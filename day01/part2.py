@@ -1,18 +1,46 @@
 #!/usr/bin/env python3
+from functools import lru_cache
+from typing import List
+
 import pytest
 
+# Masses below this have their total fuel looked up in a table, which takes
+# about 8 bytes per mass. The masses in the input are below 3 times this, so
+# they're one step away.
+TABLE_SIZE = 1 << 16
+
 
 def fuel_for_mass(mass: int) -> int:
     fuel = max(mass // 3 - 2, 0)
     return fuel + (fuel_for_mass(fuel) if fuel > 0 else 0)
 
 
-def compute(cts: str) -> int:
+@lru_cache(maxsize=None)
+def fuel_table(size: int) -> List[int]:
+    """Total fuel for every mass below `size`, fuel for the fuel included.
+
+    Masses up to 8 need no fuel. They're always in the table, so that every
+    mass above it needs at least 1.
+    """
+    table = [0] * max(size, 9)
+    for mass in range(9, len(table)):
+        fuel = mass // 3 - 2
+        table[mass] = fuel + table[fuel]
+    return table
+
+
+def total_fuel(mass: int, table: List[int]) -> int:
+    """Same as `fuel_for_mass`, dividing only until the mass is in `table`."""
     total = 0
-    for line in cts.splitlines():
-        line_val = int(line)
-        total += fuel_for_mass(line_val)
-    return total
+    while mass >= len(table):
+        mass = mass // 3 - 2
+        total += mass
+    return total + table[mass]
+
+
+def compute(cts: str, table_size: int = TABLE_SIZE) -> int:
+    table = fuel_table(table_size)
+    return sum(total_fuel(int(line), table) for line in cts.splitlines())
 
 
 @pytest.mark.parametrize(
@@ -24,6 +52,15 @@ def compute(cts: str) -> int:
 )
 def test_compute(input_str: str, expected: int) -> None:
     assert compute(input_str) == expected
+    assert compute(input_str, 10) == expected
+
+
+def test_fuel_table() -> None:
+    for size in [0, 10, 100]:
+        table = fuel_table(size)
+        assert table == [fuel_for_mass(mass) for mass in range(max(size, 9))]
+        assert [total_fuel(mass, table) for mass in range(1000)] == [
+            fuel_for_mass(mass) for mass in range(1000)]
 
 
 def main() -> int:
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+import io
+from typing import BinaryIO, Iterator, Tuple
+
+import numpy as np
+import pytest
+
+# Bytes read at a time. Memory use depends only on this, not on the size of the
+# input.
+CHUNK_SIZE = 1 << 20
+
+
+def read_masses(f: BinaryIO,
+                chunk_size: int = CHUNK_SIZE) -> Iterator[np.ndarray]:
+    """Reads the masses from `f` a chunk at a time, yielding them as arrays."""
+    rest = b''
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        # The last line may continue in the next chunk.
+        end = chunk.rfind(b'\n') + 1
+        if not end:
+            rest += chunk
+            continue
+        yield np.fromstring(rest + chunk[:end], dtype=np.int64, sep=' ')
+        rest = chunk[end:]
+    if rest.strip():
+        yield np.fromstring(rest, dtype=np.int64, sep=' ')
+
+
+def fuel_for_masses(masses: np.ndarray) -> int:
+    return int((masses // 3 - 2).sum())
+
+
+def total_fuel_for_masses(masses: np.ndarray) -> int:
+    """Fuel for the masses, and for that fuel, and so on until none is left."""
+    total = 0
+    fuel = masses
+    while len(fuel):
+        fuel = fuel // 3 - 2
+        fuel = fuel[fuel > 0]
+        total += int(fuel.sum())
+    return total
+
+
+def compute(f: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Tuple[int, int]:
+    """Fuel for part 1 and part 2, in one pass over `f`."""
+    part1 = part2 = 0
+    for masses in read_masses(f, chunk_size):
+        part1 += fuel_for_masses(masses)
+        part2 += total_fuel_for_masses(masses)
+    return part1, part2
+
+
+@pytest.mark.parametrize(
+    'input_str, expected', [
+        ('14', (2, 2)),
+        ('1969\n', (654, 966)),
+        ('12\n14\n1969\n100756', (2 + 2 + 654 + 33583, 2 + 2 + 966 + 50346)),
+    ]
+)
+def test_compute(input_str: str, expected: Tuple[int, int]) -> None:
+    for chunk_size in [1, 3, 5, CHUNK_SIZE]:
+        assert compute(io.BytesIO(input_str.encode()), chunk_size) == expected
+
+
+def main() -> int:
+    with open('input.txt', 'rb') as f:
+        part1, part2 = compute(f)
+
+    print(part1)
+    print(part2)
+
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -1,34 +1,35 @@
 #!/usr/bin/env python3
+import os
+import sys
 import pytest
 
-from typing import List, Dict, Callable, Optional
+from typing import List, Optional
 
+import numpy as np
 
-OPCODES: Dict[int, Callable[[int, int], int]] = {
-    1: lambda a, b: a + b,
-    2: lambda a, b: a * b,
-}
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from intcode import Intcode, str_to_prog  # noqa: E402
+from intcode.vectorized import VectorIntcode  # noqa: E402
 
 
 def run_program(mem: List[int]) -> List[int]:
-    mem = mem[:]
-    pc = 0
-    while mem[pc] != 99:
-        opcode, pos_a, pos_b, pos_c = mem[pc:pc + 4]
-        mem[pos_c] = OPCODES[opcode](mem[pos_a], mem[pos_b])
-        pc += 4
-    return mem
+    intcode = Intcode(mem)
+    intcode.run()
+    return intcode.prog[:len(mem)]
 
 
 def compute(cts: str) -> Optional[int]:
-    mem = list(map(int, cts.strip().split(',')))
-    for a in range(100):
-        for b in range(100):
-            mem[1] = a
-            mem[2] = b
-            if run_program(mem)[0] == 19690720:
-                return 100 * a + b
-    return None
+    # Every noun and verb pair runs in its own lane, lane 100 * noun + verb.
+    intcode = VectorIntcode(str_to_prog(cts), 100 * 100)
+    intcode.mem[:, 1] = np.repeat(np.arange(100), 100)
+    intcode.mem[:, 2] = np.tile(np.arange(100), 100)
+    intcode.run()
+
+    # Lanes that overflowed continue in scalar VMs, so their memory isn't in
+    # `mem` anymore.
+    return next((lane for lane in range(intcode.lanes)
+                 if intcode.memory(lane)[0] == 19690720), None)
 
 
 @pytest.mark.parametrize(
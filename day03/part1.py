@@ -1,42 +1,16 @@
 #!/usr/bin/env python3
 import pytest
 
-from typing import Dict, Callable, Tuple, List, Set
-
-Position = Tuple[int, int]
-
-
-DIR_UPDATES: Dict[str, Callable[[Position], Position]] = {
-    'R': lambda p: (p[0], p[1] + 1),
-    'L': lambda p: (p[0], p[1] - 1),
-    'U': lambda p: (p[0] + 1, p[1]),
-    'D': lambda p: (p[0] - 1, p[1]),
-}
-
-
-def manhattan_distance(pos: Position) -> int:
-    x, y = pos
-    return abs(x) + abs(y)
-
-
-def compute_wire(wire: List[str]) -> Set[Position]:
-    ret = set()
-    pos = (0, 0)
-    for instr in wire:
-        direction, steps = instr[0], int(instr[1:])
-        for _ in range(steps):
-            pos = DIR_UPDATES[direction](pos)
-            ret.add(pos)
-    return ret
+import segments
 
 
 def compute(cts: str) -> int:
-    wires = [line.split(',') for line in cts.strip().splitlines()]
-    area_a, area_b = map(compute_wire, wires)
-
-    intersections = area_a & area_b
-
-    return min(map(manhattan_distance, intersections))
+    # Any number of wires, of which the two that cross closest to the origin
+    # count.
+    index = segments.WireIndex()
+    for wire in segments.parse(cts):
+        index.add(wire)
+    return index.min_distance()[0]
 
 
 @pytest.mark.parametrize(
@@ -1,42 +1,16 @@
 #!/usr/bin/env python3
 import pytest
 
-from typing import Dict, Tuple, Set, List, Callable
-
-Position = Tuple[int, int]
-
-
-DIR_UPDATES: Dict[str, Callable[[Position], Position]] = {
-    'R': lambda p: (p[0], p[1] + 1),
-    'L': lambda p: (p[0], p[1] - 1),
-    'U': lambda p: (p[0] + 1, p[1]),
-    'D': lambda p: (p[0] - 1, p[1]),
-}
-
-
-def compute_wire(wire: List[str]) -> Tuple[Set[Position], Dict[Position, int]]:
-    ret = set()
-    steps = {}
-    pos = (0, 0)
-    total_steps = 0
-    for instr in wire:
-        direction, instr_steps = instr[0], int(instr[1:])
-        for _ in range(instr_steps):
-            pos = DIR_UPDATES[direction](pos)
-            total_steps += 1
-            if pos not in steps:
-                steps[pos] = total_steps
-            ret.add(pos)
-    return ret, steps
+import segments
 
 
 def compute(cts: str) -> int:
-    wires = [line.split(',') for line in cts.strip().splitlines()]
-    (area_a, steps_a), (area_b, steps_b) = map(compute_wire, wires)
-
-    intersections = area_a & area_b
-
-    return min(steps_a[pos] + steps_b[pos] for pos in intersections)
+    # Any number of wires, of which the two that cross in the fewest steps
+    # count.
+    index = segments.WireIndex()
+    for wire in segments.parse(cts):
+        index.add(wire)
+    return index.min_delay()[0]
 
 
 @pytest.mark.parametrize(
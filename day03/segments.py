@@ -0,0 +1,322 @@
+import random
+from bisect import bisect_left, insort
+from collections import defaultdict
+from typing import DefaultDict, Dict, Iterator, List, Optional, Tuple
+
+import pytest
+
+# A straight piece of wire: the coordinate that doesn't change along it, the
+# range [lo, hi] of the one that does, the steps taken by the wire at lo, and
+# +1 if the steps increase towards hi or -1 if they decrease. The point where
+# the piece starts isn't included, it belongs to the piece before it, so every
+# point is in it once per time the wire visits it.
+Segment = Tuple[int, int, int, int, int]
+
+# A point on both wires, (x, y, steps for the first wire, steps for the
+# second).
+Crossing = Tuple[int, int, int, int]
+
+DIRECTIONS: Dict[str, Tuple[int, int]] = {
+    'R': (1, 0),
+    'L': (-1, 0),
+    'U': (0, 1),
+    'D': (0, -1),
+}
+
+
+class Wire:
+    """A wire as its horizontal segments along x, and vertical ones along y."""
+    horizontal: List[Segment]
+    vertical: List[Segment]
+
+    def __init__(self, path: List[str]):
+        self.horizontal = []
+        self.vertical = []
+        x = y = steps = 0
+        for instr in path:
+            (dx, dy), n = DIRECTIONS[instr[0]], int(instr[1:])
+            if n == 0:
+                continue
+            if dy == 0:
+                first, x = x + dx, x + dx * n
+                self.horizontal.append(segment(y, first, x, steps + 1))
+            else:
+                first, y = y + dy, y + dy * n
+                self.vertical.append(segment(x, first, y, steps + 1))
+            steps += n
+
+
+def segment(fixed: int, first: int, last: int, first_steps: int) -> Segment:
+    if first <= last:
+        return fixed, first, last, first_steps, 1
+    return fixed, last, first, first_steps + first - last, -1
+
+
+def steps_at(seg: Segment, pos: int) -> int:
+    return seg[3] + seg[4] * (pos - seg[1])
+
+
+def perpendicular(horizontal: List[Segment],
+                  vertical: List[Segment]) -> Iterator[Crossing]:
+    """Points where horizontal and vertical segments cross.
+
+    The steps of the horizontal segment come first.
+
+    Sweeps a vertical line over x, keeping the y of the horizontal segments it
+    crosses in a sorted list, and looks up the range of every vertical segment
+    it meets in there.
+    """
+    # Horizontal segments enter the sweep before and leave it after the
+    # vertical ones on the same x are looked up, since their ends count as
+    # crossings too.
+    ENTER, QUERY, LEAVE = range(3)
+    events = []
+    for i, (_, lo, hi, _, _) in enumerate(horizontal):
+        events.append((lo, ENTER, i))
+        events.append((hi, LEAVE, i))
+    for i, (x, _, _, _, _) in enumerate(vertical):
+        events.append((x, QUERY, i))
+    events.sort()
+
+    active: List[Tuple[int, int]] = []
+    for x, kind, i in events:
+        if kind == ENTER:
+            insort(active, (horizontal[i][0], i))
+        elif kind == LEAVE:
+            del active[bisect_left(active, (horizontal[i][0], i))]
+        else:
+            seg = vertical[i]
+            k = bisect_left(active, (seg[1], -1))
+            while k < len(active) and active[k][0] <= seg[2]:
+                y, j = active[k]
+                yield x, y, steps_at(horizontal[j], x), steps_at(seg, y)
+                k += 1
+
+
+def collinear(a: List[Segment], b: List[Segment]
+              ) -> Iterator[Tuple[int, int, int, Segment, Segment]]:
+    """Stretches where segments of `a` and `b` lie on the same line.
+
+    Yields the line, the range [lo, hi] they share and the two segments.
+    """
+    lines: DefaultDict[int, List[Tuple[int, int, int, Segment]]] = \
+        defaultdict(list)
+    for which, segments in enumerate([a, b]):
+        for seg in segments:
+            lines[seg[0]].append((seg[1], seg[2], which, seg))
+
+    for fixed, line in lines.items():
+        line.sort()
+        active: List[List[Segment]] = [[], []]
+        for lo, hi, which, seg in line:
+            other = [o for o in active[1 - which] if o[2] >= lo]
+            active[1 - which] = other
+            for o in other:
+                pair = (seg, o) if which == 0 else (o, seg)
+                yield fixed, lo, min(hi, o[2]), pair[0], pair[1]
+            active[which].append(seg)
+
+
+def crossings(a: Wire, b: Wire) -> Iterator[Crossing]:
+    """Points where the two wires cross, once for every pair of visits.
+
+    Where the wires run along each other, only the points that can be the
+    closest to the origin or the fewest steps away are yielded: the ends of the
+    stretch they share, and its point closest to the origin.
+    """
+    yield from perpendicular(a.horizontal, b.vertical)
+    for x, y, steps_b, steps_a in perpendicular(b.horizontal, a.vertical):
+        yield x, y, steps_a, steps_b
+
+    for horizontal, (seg_a, seg_b) in [(True, (a.horizontal, b.horizontal)),
+                                       (False, (a.vertical, b.vertical))]:
+        for fixed, lo, hi, sa, sb in collinear(seg_a, seg_b):
+            yield from shared_stretch(horizontal, fixed, lo, hi, sa, sb)
+
+
+def shared_stretch(horizontal: bool, fixed: int, lo: int, hi: int,
+                   a: Segment, b: Segment) -> Iterator[Crossing]:
+    """The points of a shared stretch that `crossings` yields, lo first."""
+    for pos in sorted({lo, hi, min(max(0, lo), hi)}):
+        x, y = (pos, fixed) if horizontal else (fixed, pos)
+        yield x, y, steps_at(a, pos), steps_at(b, pos)
+
+
+def closest_crossing(a: Wire, b: Wire) -> int:
+    return min(abs(x) + abs(y) for x, y, _, _ in crossings(a, b))
+
+
+def fewest_steps(a: Wire, b: Wire) -> int:
+    return min(steps_a + steps_b for _, _, steps_a, steps_b in crossings(a, b))
+
+
+# Side of the grid cells segments are bucketed in by `WireIndex`.
+CELL_SIZE = 256
+
+
+def segment_crossings(horizontal_a: bool, a: Segment,
+                      horizontal_b: bool, b: Segment) -> Iterator[Crossing]:
+    """Points where two segments cross, like `crossings` for whole wires."""
+    if horizontal_a != horizontal_b:
+        h, v = (a, b) if horizontal_a else (b, a)
+        if h[1] <= v[0] <= h[2] and v[1] <= h[0] <= v[2]:
+            x, y = v[0], h[0]
+            if horizontal_a:
+                yield x, y, steps_at(a, x), steps_at(b, y)
+            else:
+                yield x, y, steps_at(a, y), steps_at(b, x)
+    elif a[0] == b[0]:
+        lo, hi = max(a[1], b[1]), min(a[2], b[2])
+        if lo <= hi:
+            yield from shared_stretch(horizontal_a, a[0], lo, hi, a, b)
+
+
+class WireIndex:
+    """Any number of wires, with the crossings of every pair of them.
+
+    Segments are bucketed in a uniform grid of `cell_size` cells. A wire that
+    is added is only compared with the segments in the cells it passes through,
+    so the work depends on how close it comes to the other wires rather than on
+    how many there are. A pair of segments sharing several cells is only
+    counted in the cell where the crossing is, or where the stretch they share
+    starts.
+
+    Crossings are kept per pair of wires (i, j) with i < j, with the steps of
+    wire i first.
+    """
+    cell_size: int
+    wires: List[Wire]
+    grid: Dict[Tuple[int, int], List[Tuple[int, bool, Segment]]]
+    pairs: Dict[Tuple[int, int], List[Crossing]]
+
+    def __init__(self, cell_size: int = CELL_SIZE):
+        self.cell_size = cell_size
+        self.wires = []
+        self.grid = {}
+        self.pairs = {}
+
+    def cells(self, horizontal: bool,
+              seg: Segment) -> Iterator[Tuple[int, int]]:
+        size = self.cell_size
+        fixed = seg[0] // size
+        for pos in range(seg[1] // size, seg[2] // size + 1):
+            yield (pos, fixed) if horizontal else (fixed, pos)
+
+    def add(self, wire: Wire) -> int:
+        """Adds a wire and finds its crossings with the others.
+
+        Returns the index of the wire.
+        """
+        i = len(self.wires)
+        self.wires.append(wire)
+        size = self.cell_size
+        for horizontal, segments in [(True, wire.horizontal),
+                                     (False, wire.vertical)]:
+            for seg in segments:
+                for cell in self.cells(horizontal, seg):
+                    bucket = self.grid.setdefault(cell, [])
+                    for j, other_horizontal, other in bucket:
+                        if j == i:
+                            continue
+                        found = list(segment_crossings(
+                            other_horizontal, other, horizontal, seg))
+                        if found and (found[0][0] // size,
+                                      found[0][1] // size) == cell:
+                            self.pairs.setdefault((j, i), []).extend(found)
+                    bucket.append((i, horizontal, seg))
+        return i
+
+    def crossings(self, i: int, j: int) -> List[Crossing]:
+        return self.pairs.get((i, j), [])
+
+    def closest(self, i: int, j: int) -> Optional[int]:
+        return min((abs(x) + abs(y) for x, y, _, _ in self.crossings(i, j)),
+                   default=None)
+
+    def fewest_steps(self, i: int, j: int) -> Optional[int]:
+        return min((a + b for _, _, a, b in self.crossings(i, j)),
+                   default=None)
+
+    def min_distance(self) -> Tuple[int, int, int]:
+        """Distance to the crossing of any two wires closest to the origin.
+
+        Returned along with those two wires.
+        """
+        return min((abs(x) + abs(y), i, j)
+                   for (i, j), found in self.pairs.items()
+                   for x, y, _, _ in found)
+
+    def min_delay(self) -> Tuple[int, int, int]:
+        """Fewest combined steps to a crossing of any two wires.
+
+        Returned along with those two wires.
+        """
+        return min((a + b, i, j) for (i, j), found in self.pairs.items()
+                   for _, _, a, b in found)
+
+
+def parse(cts: str) -> List[Wire]:
+    return [Wire(line.split(',')) for line in cts.strip().splitlines()]
+
+
+def cells(path: List[str]) -> Dict[Tuple[int, int], int]:
+    """Every point the wire visits, with the steps of the first visit."""
+    visited: Dict[Tuple[int, int], int] = {}
+    x = y = steps = 0
+    for instr in path:
+        (dx, dy), n = DIRECTIONS[instr[0]], int(instr[1:])
+        for _ in range(n):
+            x, y, steps = x + dx, y + dy, steps + 1
+            visited.setdefault((x, y), steps)
+    return visited
+
+
+@pytest.mark.parametrize(
+    'input_str', [
+        'R8,U5,L5,D3\nU7,R6,D4,L4',
+        'R75,D30,R83,U83,L12,D49,R71,U7,L72\nU62,R66,U55,R34,D71,R55,D58,R83',
+        # Wires running along each other, both ways, and through the origin.
+        'R10,U2,L20\nR5,U2,R10,D4,L12,U2',
+        'R4,L8,U3\nL2,R9,U1,L1,D6',
+        'U3,D5,R0,L2\nD1,U1',
+    ]
+)
+def test_crossings(input_str: str) -> None:
+    paths = [line.split(',') for line in input_str.splitlines()]
+    a, b = map(cells, paths)
+    common = a.keys() & b.keys()
+    wires = parse(input_str)
+    for x, y, steps_a, steps_b in crossings(*wires):
+        assert (x, y) in common
+        assert steps_a >= a[x, y] and steps_b >= b[x, y]
+    assert closest_crossing(*wires) == min(abs(x) + abs(y) for x, y in common)
+    assert fewest_steps(*wires) == min(a[pos] + b[pos] for pos in common)
+
+
+def test_long_segments() -> None:
+    a, b = parse('R1000000,U1000000\nU500000,R2000000')
+    assert list(crossings(a, b)) == [(1000000, 500000, 1500000, 1500000)]
+
+
+@pytest.mark.parametrize('cell_size', [1, 4, CELL_SIZE])
+def test_wire_index(cell_size: int) -> None:
+    rng = random.Random(cell_size)
+    paths = [[rng.choice('RLUD') + str(rng.randrange(0, 12))
+              for _ in range(20)]
+             for _ in range(8)]
+    wires = [Wire(path) for path in paths]
+    index = WireIndex(cell_size)
+    assert [index.add(wire) for wire in wires] == list(range(8))
+
+    for i in range(8):
+        for j in range(i + 1, 8):
+            found = sorted(index.crossings(i, j))
+            assert found == sorted(crossings(wires[i], wires[j]))
+            if found:
+                a, b = wires[i], wires[j]
+                assert index.closest(i, j) == closest_crossing(a, b)
+                assert index.fewest_steps(i, j) == fewest_steps(a, b)
+    assert index.min_distance() == min(
+        (closest_crossing(wires[i], wires[j]), i, j) for i, j in index.pairs)
+    assert index.min_delay() == min((fewest_steps(wires[i], wires[j]), i, j)
+                                    for i, j in index.pairs)
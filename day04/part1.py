@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 import pytest
 
-from typing import Iterable
+import passwords
 
 
 def meets_criteria(n: int) -> bool:
@@ -14,8 +14,8 @@ def meets_criteria(n: int) -> bool:
     return any(cur == nex for cur, nex in zipped)
 
 
-def compute(input_range: Iterable[int]) -> int:
-    return len(list(filter(meets_criteria, input_range)))
+def compute(input_range: range) -> int:
+    return passwords.count(input_range.start, input_range.stop)
 
 
 @pytest.mark.parametrize(
@@ -29,6 +29,12 @@ def test_compute(input_i: int, expected: bool) -> None:
     assert meets_criteria(input_i) == expected
 
 
+def test_count() -> None:
+    input_range = range(353096, 363096)
+    expected = len(list(filter(meets_criteria, input_range)))
+    assert compute(input_range) == expected
+
+
 def main() -> int:
     print(compute(range(353096, 843212)))
 
@@ -1,10 +1,12 @@
 #!/usr/bin/env python3
 from collections import defaultdict
 
-from typing import Iterable, Dict
+from typing import Dict
 
 import pytest
 
+import passwords
+
 
 def meets_criteria(n: int) -> bool:
     digits = list(map(int, str(n)))
@@ -24,8 +26,9 @@ def meets_criteria(n: int) -> bool:
     return False
 
 
-def compute(input_range: Iterable[int]) -> int:
-    return len(list(filter(meets_criteria, input_range)))
+def compute(input_range: range) -> int:
+    return passwords.count(input_range.start, input_range.stop,
+                           passwords.exact_pair)
 
 
 @pytest.mark.parametrize(
@@ -47,6 +50,12 @@ def test_compute(input_i: int, expected: bool) -> None:
     assert meets_criteria(input_i) == expected
 
 
+def test_count() -> None:
+    input_range = range(353096, 363096)
+    expected = len(list(filter(meets_criteria, input_range)))
+    assert compute(input_range) == expected
+
+
 def main() -> int:
     print(compute(range(353096, 843212)))
 
@@ -0,0 +1,147 @@
+from functools import lru_cache
+from math import comb
+from typing import Callable, Iterator, List, Tuple
+
+import pytest
+
+# Whether a run of equal digits of some length makes a password valid. Runs of
+# 3 or more are all passed as 3.
+Rule = Callable[[int], bool]
+
+# The last digit, how many times it's repeated at the end, and whether there
+# was a run before those that makes the password valid.
+State = Tuple[int, int, bool]
+
+# No digits yet, and the first one can't be a 0.
+START: State = (1, 0, False)
+
+
+def any_pair(run: int) -> bool:
+    """Part 1: two adjacent digits are the same."""
+    return run >= 2
+
+
+def exact_pair(run: int) -> bool:
+    """Part 2: two adjacent digits are the same, and not in a larger group."""
+    return run == 2
+
+
+def extend(last: int, run: int, ok: bool, digit: int, rule: Rule) -> State:
+    """State after appending `digit` to digits ending in `run` times `last`."""
+    if run and digit == last:
+        return digit, min(run + 1, 3), ok
+    return digit, 1, ok or rule(run)
+
+
+@lru_cache(maxsize=None)
+def completions(remaining: int, last: int, run: int, ok: bool,
+                rule: Rule) -> int:
+    """Ways to append `remaining` non-decreasing digits and end up valid."""
+    if remaining == 0:
+        return 1 if ok or rule(run) else 0
+    return sum(completions(remaining - 1, *extend(last, run, ok, digit, rule),
+                           rule)
+               for digit in range(last, 10))
+
+
+def count_up_to(bound: int, rule: Rule) -> int:
+    """Valid passwords with as many digits as `bound`, and no larger."""
+    digits = list(map(int, str(bound)))
+    total = 0
+    last, run, ok = START
+    for i, bound_digit in enumerate(digits):
+        remaining = len(digits) - i - 1
+        for digit in range(last, bound_digit):
+            state = extend(last, run, ok, digit, rule)
+            total += completions(remaining, *state, rule)
+        if bound_digit < last:
+            # No number with this prefix is non-decreasing.
+            return total
+        last, run, ok = extend(last, run, ok, bound_digit, rule)
+    return total + (1 if ok or rule(run) else 0)
+
+
+def count(lo: int, hi: int, rule: Rule = any_pair) -> int:
+    """Number of valid passwords in range(lo, hi), without looking at any.
+
+    Passwords have non-decreasing digits, and a run of equal digits that `rule`
+    accepts. Every number of digits in the range is counted with a digit DP
+    over the runs.
+    """
+    total = 0
+    lo = max(lo, 10)
+    for length in range(len(str(lo)), len(str(max(hi - 1, 1))) + 1):
+        first = max(lo, 10 ** (length - 1))
+        last = min(hi - 1, 10 ** length - 1)
+        if first <= last:
+            total += count_up_to(last, rule)
+            if first > 10 ** (length - 1):
+                total -= count_up_to(first - 1, rule)
+    return total
+
+
+def passwords(lo: int, hi: int, rule: Rule = any_pair) -> Iterator[int]:
+    """Valid passwords in range(lo, hi), in increasing order.
+
+    Only prefixes that have valid completions in the range are followed, so
+    every value yielded takes work in proportion to its number of digits.
+    """
+    def walk(prefix: int, remaining: int, last: int, run: int,
+             ok: bool) -> Iterator[int]:
+        scale = 10 ** remaining
+        if (prefix + 1) * scale <= lo or prefix * scale >= hi:
+            return
+        if remaining == 0:
+            if ok or rule(run):
+                yield prefix
+            return
+        for digit in range(last, 10):
+            state = extend(last, run, ok, digit, rule)
+            if completions(remaining - 1, *state, rule):
+                yield from walk(prefix * 10 + digit, remaining - 1, *state)
+
+    for length in range(max(2, len(str(lo))), len(str(max(hi - 1, 1))) + 1):
+        yield from walk(0, length, *START)
+
+
+def brute_force(lo: int, hi: int, rule: Rule) -> List[int]:
+    found = []
+    for n in range(lo, hi):
+        digits = str(n)
+        if list(digits) != sorted(digits):
+            continue
+        runs = [1]
+        for cur, nex in zip(digits, digits[1:]):
+            if cur == nex:
+                runs[-1] += 1
+            else:
+                runs.append(1)
+        if any(rule(min(run, 3)) for run in runs):
+            found.append(n)
+    return found
+
+
+@pytest.mark.parametrize('rule', [any_pair, exact_pair])
+@pytest.mark.parametrize(
+    'lo, hi', [
+        (0, 1000),
+        (353096, 353096 + 5000),
+        (111110, 111112),
+        (99, 100000),
+        (123456, 123457),
+        (555555, 555556),
+    ]
+)
+def test_count(lo: int, hi: int, rule: Rule) -> None:
+    expected = brute_force(lo, hi, rule)
+    assert count(lo, hi, rule) == len(expected)
+    assert list(passwords(lo, hi, rule)) == expected
+
+
+def test_many_digits() -> None:
+    # Non-decreasing sequences of n digits from 1 to 9, minus those with all
+    # digits different.
+    for n in [6, 12, 16]:
+        assert count(10 ** (n - 1), 10 ** n) == comb(n + 8, 8) - comb(9, n)
+    found = passwords(10 ** 11, 10 ** 12, exact_pair)
+    assert count(10 ** 11, 10 ** 12, exact_pair) == sum(1 for _ in found)
@@ -1,77 +1,19 @@
 #!/usr/bin/env python3
-import pytest
-
-from typing import List, Dict, Callable, Tuple
-
-Program = List[int]
-
-
-class Intcode:
-    def __init__(self, mem: Program, debug_enabled: bool = False):
-        self.debug_enabled = debug_enabled
-        self.pc = 0
-        self.mem = mem[:]
-        self.num_input_commands = 0
-
-    def run_program(self) -> Program:
-        OPCODES: Dict[int, Tuple[Callable[..., None], int]] = {
-            1: (self.do_add, 2),
-            2: (self.do_mul, 2),
-            3: (self.do_input, 0),
-            4: (self.do_output, 1),
-        }
-
-        while self.mem[self.pc] != 99:
-            opcode = self.mem[self.pc]
-            param_types, opcode = opcode // 100, opcode % 100
-
-            fn, num_args = OPCODES[opcode]
+import os
+import sys
 
-            args = self.mem[self.pc + 1:self.pc + 1 + num_args][:]
-            for i, arg in enumerate(args):
-                if param_types % 10 == 0:
-                    args[i] = self.mem[arg]
-                param_types //= 10
-
-            assert opcode >= 0
-            self.debug('opcode', opcode, 'at', self.pc, 'has param_types', param_types)
-            fn(*args)
-
-        return self.mem
-
-    def do_add(self, a: int, b: int) -> None:
-        c = self.mem[self.pc + 3]
-        self.debug('mem', c, '=', a, '+', b)
-        self.mem[c] = a + b
-        self.pc += 4
-
-    def do_mul(self, a: int, b: int) -> None:
-        c = self.mem[self.pc + 3]
-        self.debug('mem', c, '=', a, '*', b)
-        self.mem[c] = a * b
-        self.pc += 4
-
-    def do_input(self) -> None:
-        assert self.num_input_commands == 0
-        self.num_input_commands += 1
-
-        a = self.mem[self.pc + 1]
-        self.mem[a] = 1
-        self.debug('mem', a, '= 1')
-        self.pc += 2
-
-    def do_output(self, a: int) -> None:
-        print('OUTPUT:', a)
-        self.pc += 2
+import pytest
 
-    def debug(self, *args) -> None:
-        if self.debug_enabled:
-            print(*args)
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from intcode import Intcode, Program  # noqa: E402
 
 
 def run_program(mem: Program) -> Program:
-    intcode = Intcode(mem)
-    return intcode.run_program()
+    intcode = Intcode(mem, [1])
+    for output in intcode.iterable():
+        print('OUTPUT:', output)
+    return intcode.prog[:len(mem)]
 
 
 def compute(cts: str) -> Program:
@@ -1,94 +1,15 @@
 #!/usr/bin/env python
+import os
+import sys
 from itertools import permutations
 
 import pytest
 
-from typing import List, Dict, Callable, Iterator
+from typing import Iterator
 
-Program = List[int]
-
-
-class Intcode:
-    def __init__(self, prog: Program, inputs: Iterator[int]):
-        self.prog = prog[:]
-        self.pc = 0
-        self.inputs = inputs
-        self.output = 0
-        self.param_spec = 0
-
-    def get_param(self, output=False):
-        ret = self.prog[self.pc]
-        self.pc += 1
-        if not output:
-            if self.param_spec % 10 == 0:
-                ret = self.prog[ret]
-            self.param_spec //= 10
-        return ret
-
-    def run(self) -> None:
-        OPCODES: Dict[int, Callable[..., None]] = {
-            1: self.op_add,
-            2: self.op_multiply,
-            3: self.op_input,
-            4: self.op_output,
-            5: self.op_jump_if_true,
-            6: self.op_jump_if_false,
-            7: self.op_less_than,
-            8: self.op_equals,
-        }
-
-        while True:
-            opc = self.get_param(output=True)
-            opc, self.param_spec = opc % 100, opc // 100
-            if opc == 99:
-                break
-
-            fn = OPCODES[opc]
-            fn()
-
-    def op_add(self):
-        a = self.get_param()
-        b = self.get_param()
-        c = self.get_param(output=True)
-        self.prog[c] = a + b
-
-    def op_multiply(self):
-        a = self.get_param()
-        b = self.get_param()
-        c = self.get_param(output=True)
-        self.prog[c] = a * b
-
-    def op_input(self):
-        a = self.get_param(output=True)
-        self.prog[a] = next(self.inputs)
-
-    def op_output(self):
-        self.output = self.get_param()
-        # print('OUTPUT:', self.output)
-
-    def op_jump_if_true(self):
-        a = self.get_param()
-        b = self.get_param()
-        if a:
-            self.pc = b
-
-    def op_jump_if_false(self):
-        a = self.get_param()
-        b = self.get_param()
-        if not a:
-            self.pc = b
-
-    def op_less_than(self):
-        a = self.get_param()
-        b = self.get_param()
-        c = self.get_param(output=True)
-        self.prog[c] = 1 if a < b else 0
-
-    def op_equals(self):
-        a = self.get_param()
-        b = self.get_param()
-        c = self.get_param(output=True)
-        self.prog[c] = 1 if a == b else 0
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from intcode import Intcode, Program  # noqa: E402
 
 
 def compute_once(prog: Program, inputs: Iterator[int]) -> int:
@@ -1,121 +1,36 @@
 #!/usr/bin/env python
-from itertools import permutations, cycle
+import asyncio
+import os
+import sys
+from itertools import permutations
 
 import pytest
 
-from typing import List, Dict, Callable, Iterator, Generator
-
-Program = List[int]
-
-
-class Intcode:
-    def __init__(self, prog: Program, inputs: Iterator[int]):
-        self.prog = prog[:]
-        self.pc = 0
-        self.inputs = inputs
-        self.output = 0
-        self.param_spec = 0
-
-    def get_param(self, output=False):
-        ret = self.prog[self.pc]
-        self.pc += 1
-        if not output:
-            if self.param_spec % 10 == 0:
-                ret = self.prog[ret]
-            self.param_spec //= 10
-        return ret
-
-    def run(self) -> None:
-        for _ in self.run_until_output():
-            pass
-
-    def feed(self, inputs):
-        self.inputs = inputs
-        for output in self.run_until_output():
-            return output
-
-    def run_until_output(self) -> Generator[int, int, None]:
-        OPCODES: Dict[int, Callable[..., None]] = {
-            1: self.op_add,
-            2: self.op_multiply,
-            3: self.op_input,
-            4: self.op_output,
-            5: self.op_jump_if_true,
-            6: self.op_jump_if_false,
-            7: self.op_less_than,
-            8: self.op_equals,
-        }
-
-        while True:
-            opc = self.get_param(output=True)
-            opc, self.param_spec = opc % 100, opc // 100
-            if opc == 99:
-                break
-
-            fn = OPCODES[opc]
-            fn()
-            if opc == 4:
-                yield self.output
-
-    def op_add(self):
-        a = self.get_param()
-        b = self.get_param()
-        c = self.get_param(output=True)
-        self.prog[c] = a + b
-
-    def op_multiply(self):
-        a = self.get_param()
-        b = self.get_param()
-        c = self.get_param(output=True)
-        self.prog[c] = a * b
-
-    def op_input(self):
-        a = self.get_param(output=True)
-        self.prog[a] = next(self.inputs)
-
-    def op_output(self):
-        self.output = self.get_param()
-        # print('OUTPUT:', self.output)
-
-    def op_jump_if_true(self):
-        a = self.get_param()
-        b = self.get_param()
-        if a:
-            self.pc = b
-
-    def op_jump_if_false(self):
-        a = self.get_param()
-        b = self.get_param()
-        if not a:
-            self.pc = b
-
-    def op_less_than(self):
-        a = self.get_param()
-        b = self.get_param()
-        c = self.get_param(output=True)
-        self.prog[c] = 1 if a < b else 0
-
-    def op_equals(self):
-        a = self.get_param()
-        b = self.get_param()
-        c = self.get_param(output=True)
-        self.prog[c] = 1 if a == b else 0
+from typing import List
 
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from intcode import Program  # noqa: E402
+from intcode.aio import AsyncIntcode  # noqa: E402
 
-def compute_once(prog: Program, inputs: List[int]) -> int:
-    ints = [Intcode(prog, iter([i])) for i in inputs]
 
-    last_output = 0
-    for i, intc in enumerate(ints):
-        last_output = intc.feed(iter([inputs[i], last_output]))
+async def run_amplifiers(prog: Program, inputs: List[int]) -> int:
+    # Every amplifier reads from its own queue and writes to the next one's.
+    queues: 'List[asyncio.Queue[int]]' = [asyncio.Queue() for _ in inputs]
+    for queue, phase in zip(queues, inputs):
+        queue.put_nowait(phase)
+    queues[0].put_nowait(0)
+
+    amps = [AsyncIntcode(prog, queue, queues[(i + 1) % len(queues)])
+            for i, queue in enumerate(queues)]
+    await asyncio.gather(*(amp.run() for amp in amps))
 
-    for intc in cycle(ints):
-        output = intc.feed(iter([last_output]))
-        if output is None:
-            break
-        last_output = output
+    # The last output of the last amplifier is left unread by the first one.
+    return queues[0].get_nowait()
 
-    return last_output
+
+def compute_once(prog: Program, inputs: List[int]) -> int:
+    return asyncio.run(run_amplifiers(prog, inputs))
 
 
 def compute_best(cts: str):
@@ -1,125 +1,15 @@
 #!/usr/bin/env python3
-from itertools import combinations
-from typing import List, Iterator, Generator, Dict, Callable, Tuple, Optional, Set
+import os
+import sys
+from typing import List, Generator, Tuple, Optional, Set
 
-Program = List[int]
-Coord = Tuple[int, int]
-
-
-def str_to_prog(s: str) -> List[int]:
-    return list(map(int, s.strip().split(',')))
-
-
-class Intcode:
-    def __init__(self, prog: Program, inputs: Iterator[int] = iter([])):
-        self.prog = prog[:] + [0] * (1024 * 1024 - len(prog))
-        self.pc = 0
-        self.inputs = iter(inputs)
-        self.output = 0
-        self.param_spec = 0
-        self.rel_base = 0
-
-    def get_param(self, is_write: bool = False) -> int:
-        ret = self.prog[self.pc]
-        self.pc += 1
-
-        addr_mode = self.param_spec % 10
-        self.param_spec //= 10
-
-        if not is_write:
-            if addr_mode == 0:
-                ret = self.prog[ret]
-            elif addr_mode == 2:
-                ret = self.prog[self.rel_base + ret]
-        elif addr_mode == 2:
-            ret = ret + self.rel_base
-
-        return ret
-
-    def feed(self, inputs):
-        self.inputs = iter(inputs)
-        for o in self.iterable():
-            return o
-
-    def has_output(self):
-        for o in self.iterable():
-            return 0
-
-    def iterable(self) -> Generator[Optional[int], None, None]:
-        OPCODES: Dict[int, Callable[..., None]] = {
-            1: self.op_add,
-            2: self.op_multiply,
-            3: self.op_input,
-            4: self.op_output,
-            5: self.op_jump_if_true,
-            6: self.op_jump_if_false,
-            7: self.op_less_than,
-            8: self.op_equals,
-            9: self.op_rel_base,
-        }
-
-        while True:
-            opc = self.prog[self.pc]
-            self.pc += 1
-
-            opc, self.param_spec = opc % 100, opc // 100
-            if opc == 99:
-                print('halt')
-                yield None
-                break
-
-            fn = OPCODES[opc]
-
-            fn()
-            if opc == 4:
-                yield self.output
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from intcode import (  # noqa: E402
+    AsciiChannel, CompiledIntcode, Intcode, Program, str_to_prog,
+)
 
-    def op_add(self) -> None:
-        a = self.get_param()
-        b = self.get_param()
-        c = self.get_param(is_write=True)
-        self.prog[c] = a + b
-
-    def op_multiply(self) -> None:
-        a = self.get_param()
-        b = self.get_param()
-        c = self.get_param(is_write=True)
-        self.prog[c] = a * b
-
-    def op_input(self) -> None:
-        a = self.get_param(is_write=True)
-        self.prog[a] = next(self.inputs)
-
-    def op_output(self) -> None:
-        self.output = self.get_param()
-
-    def op_jump_if_true(self) -> None:
-        a = self.get_param()
-        b = self.get_param()
-        if a:
-            self.pc = b
-
-    def op_jump_if_false(self) -> None:
-        a = self.get_param()
-        b = self.get_param()
-        if not a:
-            self.pc = b
-
-    def op_less_than(self) -> None:
-        a = self.get_param()
-        b = self.get_param()
-        c = self.get_param(is_write=True)
-        self.prog[c] = 1 if a < b else 0
-
-    def op_equals(self) -> None:
-        a = self.get_param()
-        b = self.get_param()
-        c = self.get_param(is_write=True)
-        self.prog[c] = 1 if a == b else 0
-
-    def op_rel_base(self) -> None:
-        a = self.get_param()
-        self.rel_base += a
+Coord = Tuple[int, int]
 
 
 MOVES = {
@@ -150,7 +40,7 @@ class Strategy:
     def __init__(self, droid):
         self.droid = droid
 
-    def get_inputs(self) -> Generator[int, None, None]:
+    def get_inputs(self) -> Generator[str, None, None]:
         raise NotImplementedError()
 
     def on_output(self) -> None:
@@ -159,7 +49,7 @@ class Strategy:
 
 
 class CollectionStrategy(Strategy):
-    def get_inputs(self) -> Generator[int, None, None]:
+    def get_inputs(self) -> Generator[str, None, None]:
         droid = self.droid
 
         if droid.items_here:
@@ -225,24 +115,59 @@ class CollectionStrategy(Strategy):
 
 
 class GotoSecCheckStrategy(Strategy):
-    def get_inputs(self) -> Generator[int, None, None]:
+    def get_inputs(self) -> Generator[str, None, None]:
         droid = self.droid
 
-        yield from droid.move_to(droid.security_checkpoint)
-        yield from droid.drop_items(droid.inventory)
         droid.strategy = PermutateInventoryStrategy(droid)
+        yield from droid.move_to(droid.security_checkpoint)
 
 
 class PermutateInventoryStrategy(Strategy):
-    def get_inputs(self) -> Generator[int, None, None]:
+    items: Optional[List[str]] = None
+
+    def get_inputs(self) -> Generator[str, None, None]:
         droid = self.droid
 
-        for i in range(1, len(droid.inventory) + 1):
-            combs = combinations(droid.inventory, i)
-            for items in combs:
-                yield from droid.take_items(items)
-                yield from (ord(c) for c in 'south\n')
-                yield from droid.drop_items(items)
+        assert self.items is not None
+        drop = [item for item in droid.inventory if item not in self.items]
+        yield from droid.drop_items(drop)
+        yield 'south\n'
+
+    def on_output(self) -> None:
+        super().on_output()
+        droid = self.droid
+
+        if self.items is not None or droid.moves != droid.security_checkpoint:
+            return
+
+        self.items = self.find_items(droid.intc, droid.inventory)
+        print('FOUND COMBINATION', self.items)
+
+    def find_items(self, intc: Intcode,
+                   items: List[str]) -> Optional[List[str]]:
+        """Tries every combination of `items` in forks of `intc`.
+
+        Returns the combination to keep.
+
+        Each item is either kept or dropped in a fork of the VM that decided on
+        the items before it, so every combination costs a single command on top
+        of a shared prefix.
+        """
+        if not items:
+            intc = intc.fork(b'south\n')
+            for _ in intc.iterable():
+                pass
+            return [] if intc.halted else None
+
+        item, rest = items[0], items[1:]
+        found = self.find_items(intc, rest)
+        if found is not None:
+            return [item] + found
+
+        intc = intc.fork('drop {}\n'.format(item).encode())
+        for _ in intc.iterable():
+            pass
+        return self.find_items(intc, rest)
 
 
 class Droid:
@@ -255,7 +180,9 @@ class Droid:
     strategy: Strategy
 
     def __init__(self, prog: Program):
-        self.intc = Intcode(prog, self.get_inputs())
+        self.intc = CompiledIntcode(prog)
+        self.channel = AsciiChannel(self.intc, 'Command?')
+        self.channel.send_from(self.get_inputs())
 
         self.moves = ''
         self.open = []
@@ -267,17 +194,15 @@ class Droid:
 
         self.strategy = CollectionStrategy(self)
 
-    def take_items(self, items: List[str]) -> Generator[int, None, None]:
+    def take_items(self, items: List[str]) -> Generator[str, None, None]:
         for item in items:
-            for c in 'take {}\n'.format(item):
-                yield ord(c)
+            yield 'take {}\n'.format(item)
 
-    def drop_items(self, items: List[str]) -> Generator[int, None, None]:
+    def drop_items(self, items: List[str]) -> Generator[str, None, None]:
         for item in items:
-            for c in 'drop {}\n'.format(item):
-                yield ord(c)
+            yield 'drop {}\n'.format(item)
 
-    def move_to(self, goto: str) -> Generator[int, None, None]:
+    def move_to(self, goto: str) -> Generator[str, None, None]:
         for i in range(len(goto)):
             if i == len(self.moves):
                 break
@@ -288,30 +213,23 @@ class Droid:
         for move in backtrack:
             print('- backtrack:', MOVES_REV[move])
             self.moves = self.moves[:-1]
-            for c in MOVES_REV[move] + '\n':
-                yield ord(c)
+            yield MOVES_REV[move] + '\n'
 
         for move in goto[i:]:
             self.moves = self.moves + move
             print('- walking:', MOVES[move])
-            for c in MOVES[move] + '\n':
-                yield ord(c)
+            yield MOVES[move] + '\n'
 
-    def get_inputs(self) -> Generator[int, None, None]:
+    def get_inputs(self) -> Generator[str, None, None]:
         while True:
             yield from self.strategy.get_inputs()
 
     def fetch_screen(self) -> bool:
-        self.screen = ''
+        self.screen = self.channel.read()
+        assert not self.channel.values
 
-        for o in self.intc.iterable():
-            if o is None:
-                return True
-            assert 10 <= o < 128
-            self.screen += chr(o)
-
-            if self.screen.endswith('Command?\n'):
-                break
+        if self.intc.halted:
+            return True
 
         self.screen = self.screen.strip()
         return False
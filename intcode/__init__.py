@@ -0,0 +1,12 @@
+from .vm import Intcode, Program, Snapshot, Status, str_to_prog
+from .decoded import DecodedIntcode, load_decoded
+from .compiled import CompiledIntcode
+from .batch import run_batch
+from .ascii import AsciiChannel
+from .scheduler import Scheduler
+
+__all__ = [
+    'Intcode', 'DecodedIntcode', 'CompiledIntcode', 'Program', 'Snapshot',
+    'run_batch', 'AsciiChannel', 'Scheduler', 'Status', 'load_decoded',
+    'str_to_prog',
+]
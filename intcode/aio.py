@@ -0,0 +1,97 @@
+import asyncio
+from itertools import chain
+from typing import List, Optional, Type
+
+from .scheduler import available
+from .vm import Intcode, Program, str_to_prog
+
+
+class AsyncIntcode:
+    """Intcode VM taking inputs from one asyncio queue, outputs to another.
+
+    `run` executes the program on a synchronous VM of type `backend`, which
+    runs for as long as there is input waiting in the queue. When the queue is
+    empty, `run` waits for it, and other tasks get to run in the meantime.
+
+    Programs that poll for input instead of waiting for it can be given an
+    `empty` value, which is read once whenever the queue is empty. A program
+    asking again after that is considered idle: `waiting` is set, so is the
+    `idle` event if given, and it waits for the queue like any other.
+    """
+    vm: Intcode
+    inputs: 'asyncio.Queue[int]'
+    outputs: 'asyncio.Queue[int]'
+    empty: Optional[int]
+    idle: Optional[asyncio.Event]
+    waiting: bool
+
+    def __init__(self, prog: Program,
+                 inputs: 'Optional[asyncio.Queue[int]]' = None,
+                 outputs: 'Optional[asyncio.Queue[int]]' = None,
+                 backend: Type[Intcode] = Intcode, empty: Optional[int] = None,
+                 idle: Optional[asyncio.Event] = None):
+        self.vm = backend(prog)
+        self.inputs = asyncio.Queue() if inputs is None else inputs
+        self.outputs = asyncio.Queue() if outputs is None else outputs
+        self.empty = empty
+        self.idle = idle
+        self.waiting = False
+
+    def take(self) -> Optional[int]:
+        return None if self.inputs.empty() else self.inputs.get_nowait()
+
+    async def run(self) -> None:
+        vm = self.vm
+        vm.inputs = available(self.take, self.empty)
+        while True:
+            outputs = vm.take(1)
+            while outputs:
+                await self.outputs.put(outputs[0])
+                outputs = vm.take(1)
+            if vm.halted:
+                return
+
+            self.waiting = True
+            if self.idle is not None:
+                self.idle.set()
+            value = await self.inputs.get()
+            self.waiting = False
+            vm.inputs = chain([value], available(self.take, self.empty))
+
+
+def test_pipe() -> None:
+    # Outputs the double of every input.
+    prog = str_to_prog('3,100,1002,100,2,100,4,100,1105,1,0')
+
+    async def run() -> List[int]:
+        first = AsyncIntcode(prog)
+        second = AsyncIntcode(prog, first.outputs)
+        task = asyncio.ensure_future(asyncio.gather(first.run(), second.run()))
+        for value in [1, 2, 3]:
+            first.inputs.put_nowait(value)
+        outputs = [await second.outputs.get() for _ in range(3)]
+        task.cancel()
+        return outputs
+
+    assert asyncio.run(run()) == [4, 8, 12]
+
+
+def test_idle() -> None:
+    # Echoes its inputs, skipping -1.
+    prog = str_to_prog('3,100,1008,100,-1,101,1005,101,0,4,100,1105,1,0')
+
+    async def run() -> List[int]:
+        idle = asyncio.Event()
+        intc = AsyncIntcode(prog, empty=-1, idle=idle)
+        task = asyncio.ensure_future(intc.run())
+        await idle.wait()
+        assert intc.waiting and intc.outputs.empty()
+
+        idle.clear()
+        for value in [1, 2]:
+            intc.inputs.put_nowait(value)
+        await idle.wait()
+        task.cancel()
+        return [intc.outputs.get_nowait() for _ in range(intc.outputs.qsize())]
+
+    assert asyncio.run(run()) == [1, 2]
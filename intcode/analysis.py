@@ -0,0 +1,310 @@
+from typing import List, Dict, Set, Optional, Tuple
+
+import pytest
+
+from .vm import Program, ARITY, OPCODE_NAMES, str_to_prog
+
+
+class Instruction:
+    """A decoded instruction, with its parameters and their modes."""
+    pc: int
+    opcode: int
+    modes: Tuple[int, ...]
+    params: Tuple[int, ...]
+
+    def __init__(self, prog: Program, pc: int):
+        instr = prog[pc]
+        self.pc = pc
+        self.opcode = instr % 100
+        arity = ARITY[self.opcode]
+        self.modes = tuple(instr // 10 ** (i + 2) % 10 for i in range(arity))
+        self.params = tuple(prog[pc + 1:pc + 1 + arity])
+
+    @property
+    def size(self) -> int:
+        return len(self.params) + 1
+
+    @property
+    def writes(self) -> Optional[int]:
+        """Index of the parameter that is written to, if any."""
+        if self.opcode in (1, 2, 7, 8):
+            return 2
+        if self.opcode == 3:
+            return 0
+        return None
+
+    def __str__(self) -> str:
+        operands = []
+        for mode, param in zip(self.modes, self.params):
+            if mode == 0:
+                operands.append('[{}]'.format(param))
+            elif mode == 1:
+                operands.append(str(param))
+            else:
+                operands.append('[rb{:+}]'.format(param))
+        name = OPCODE_NAMES[self.opcode]
+        return '{} {}'.format(name, ', '.join(operands)).rstrip()
+
+
+class BasicBlock:
+    """Instructions from `start` up to `end` that are always executed in order.
+
+    Blocks ending in a jump with a target computed at runtime, like returns
+    from functions, are marked as `indirect`, since not all of their successors
+    are known.
+    """
+    start: int
+    end: int
+    successors: Set[int]
+    indirect: bool
+
+    def __init__(self, start: int):
+        self.start = start
+        self.end = start
+        self.successors = set()
+        self.indirect = False
+
+
+def decode(prog: Program, pc: int) -> Optional[Instruction]:
+    """Decodes the instruction at `pc`, or returns None if it isn't valid."""
+    if not 0 <= pc < len(prog) or prog[pc] % 100 not in ARITY:
+        return None
+    instr = Instruction(prog, pc)
+    if pc + instr.size > len(prog) or any(mode > 2 for mode in instr.modes):
+        return None
+    return instr
+
+
+def successors(instr: Instruction) -> Tuple[List[int], bool]:
+    """Returns the pcs that may follow `instr`, and if others may as well."""
+    nxt = instr.pc + instr.size
+    if instr.opcode == 99:
+        return [], False
+    if instr.opcode != 5 and instr.opcode != 6:
+        return [nxt], False
+
+    cond_mode, target_mode = instr.modes
+    cond, target = instr.params
+    targets = []
+    if cond_mode == 1:
+        # The jump is either always or never taken.
+        if bool(cond) == (instr.opcode == 5):
+            return ([target], False) if target_mode == 1 else ([], True)
+        return [nxt], False
+    if target_mode == 1:
+        targets.append(target)
+    targets.append(nxt)
+    return targets, target_mode != 1
+
+
+class Analysis:
+    """Static analysis of a program: reachable code, control flow and data.
+
+    Code is found by following every path from pc 0. Jumps with a computed
+    target can't be followed, so two kinds of addresses are treated as entry
+    points as well: those loaded as immediate values that directly follow a
+    jump, like the return addresses pushed when calling a function, and the
+    initial values of words that are jumped to through a static address. Every
+    word that isn't part of reachable code is considered data, dead code
+    included.
+    """
+    prog: Program
+    instructions: Dict[int, Instruction]
+    blocks: Dict[int, BasicBlock]
+    self_modifying: List[Tuple[int, int]]
+    data: List[Tuple[int, int]]
+
+    def __init__(self, prog: Program):
+        self.prog = prog
+        self.instructions = {}
+        self.explore()
+        self.build_blocks()
+
+        # Writes to static addresses in the code, by pc of the writing
+        # instruction.
+        code = self.code_words()
+        self.self_modifying = []
+        for pc, instr in sorted(self.instructions.items()):
+            i = instr.writes
+            if (i is not None and instr.modes[i] == 0 and
+                    instr.params[i] in code):
+                self.self_modifying.append((pc, instr.params[i]))
+
+        self.data = []
+        start = None
+        for addr in range(len(prog) + 1):
+            if addr < len(prog) and addr not in code:
+                if start is None:
+                    start = addr
+            elif start is not None:
+                self.data.append((start, addr))
+                start = None
+
+    def explore(self) -> None:
+        prog = self.prog
+        entries = {0}
+        seen: Set[int] = set()
+        while True:
+            todo = sorted(entries - seen)
+            if not todo:
+                return
+            while todo:
+                pc = todo.pop()
+                if pc in seen:
+                    continue
+                seen.add(pc)
+                instr = decode(prog, pc)
+                if instr is None:
+                    continue
+                self.instructions[pc] = instr
+                todo.extend(successors(instr)[0])
+
+            # Possible return addresses, see the class docstring.
+            after_jumps = {pc + instr.size
+                           for pc, instr in self.instructions.items()
+                           if instr.opcode == 5 or instr.opcode == 6}
+            for instr in self.instructions.values():
+                if instr.opcode == 1 or instr.opcode == 2:
+                    for mode, param in zip(instr.modes[:2], instr.params[:2]):
+                        if mode == 1 and param in after_jumps:
+                            entries.add(param)
+                elif ((instr.opcode == 5 or instr.opcode == 6) and
+                        instr.modes[1] == 0):
+                    if 0 <= instr.params[1] < len(prog):
+                        entries.add(prog[instr.params[1]])
+
+    def build_blocks(self) -> None:
+        leaders = {0}
+        for instr in self.instructions.values():
+            targets, _ = successors(instr)
+            if instr.opcode in (5, 6, 99):
+                leaders.update(targets)
+                leaders.add(instr.pc + instr.size)
+        leaders &= set(self.instructions)
+        # Entry points that were only found as return addresses.
+        leaders |= set(self.instructions) - {
+            pc for instr in self.instructions.values()
+            for pc in successors(instr)[0]}
+
+        self.blocks = {}
+        for start in sorted(leaders):
+            block = BasicBlock(start)
+            pc = start
+            while True:
+                instr = self.instructions[pc]
+                pc += instr.size
+                targets, block.indirect = successors(instr)
+                if (pc in leaders or pc not in self.instructions or
+                        targets != [pc]):
+                    break
+            block.end = pc
+            block.successors = {target for target in targets
+                                if target in self.instructions}
+            self.blocks[start] = block
+
+    def code_words(self) -> Set[int]:
+        return {pc + i for pc, instr in self.instructions.items()
+                for i in range(instr.size)}
+
+    def loops_with_output(self) -> List[int]:
+        """Start of every block that outputs something and can reach itself.
+
+        These are the loops printing strings, like the ASCII screens of day 17,
+        21 and 25.
+        """
+        found = []
+        for start, block in sorted(self.blocks.items()):
+            if not any(self.instructions[pc].opcode == 4
+                       for pc in self.block_pcs(block)):
+                continue
+            seen: Set[int] = set()
+            todo = list(block.successors)
+            while todo:
+                pc = todo.pop()
+                if pc == start:
+                    found.append(start)
+                    break
+                if pc not in seen:
+                    seen.add(pc)
+                    todo.extend(self.blocks[pc].successors)
+        return found
+
+    def block_pcs(self, block: BasicBlock) -> List[int]:
+        pcs = []
+        pc = block.start
+        while pc < block.end:
+            pcs.append(pc)
+            pc += self.instructions[pc].size
+        return pcs
+
+    def disassemble(self) -> str:
+        """Listing of the program, as mnemonics for code and words for data."""
+        modified = {addr for _, addr in self.self_modifying}
+        lines = []
+        code = [(pc, pc + instr.size)
+                for pc, instr in self.instructions.items()]
+        for start, end in sorted(code + self.data):
+            if start in self.blocks:
+                block = self.blocks[start]
+                succ = ', '.join(map(str, sorted(block.successors)))
+                lines.append('block {} -> {}{}'.format(
+                    start, succ or '-',
+                    ' (indirect)' if block.indirect else ''))
+            if start in self.instructions:
+                instr = self.instructions[start]
+                mark = ' '
+                if any(addr in modified for addr in range(start, end)):
+                    mark = '*'
+                lines.append('{:>6}{} {}'.format(start, mark, instr))
+            else:
+                words = ','.join(map(str, self.prog[start:end]))
+                lines.append('{:>6}  data {}'.format(start, words))
+        return '\n'.join(lines)
+
+
+def analyze(prog: Program) -> Analysis:
+    return Analysis(prog)
+
+
+# Calls a function that outputs the words from 11 down to 1, with data between
+# the halt and it.
+CALL_PROG = ('109,100,21101,9,0,0,1105,1,16,99,42,0,0,0,0,0,'
+             '4,11,1001,17,-1,17,1005,17,16,2106,0,0')
+
+
+def test_instruction() -> None:
+    prog = str_to_prog('21101,7,-3,1,1106,0,5,99')
+    assert str(Instruction(prog, 0)) == 'add 7, -3, [rb+1]'
+    assert str(Instruction(prog, 4)) == 'jz 0, 5'
+    assert str(Instruction(prog, 7)) == 'halt'
+
+
+def test_analysis() -> None:
+    analysis = analyze(str_to_prog(CALL_PROG))
+    assert sorted(analysis.instructions) == [0, 2, 6, 9, 16, 18, 22, 25]
+    assert {start: (block.end, block.successors, block.indirect)
+            for start, block in analysis.blocks.items()} == {
+        0: (9, {16}, False),
+        9: (10, set(), False),
+        16: (25, {16, 25}, False),
+        25: (28, set(), True),
+    }
+    assert analysis.self_modifying == [(18, 17)]
+    assert analysis.data == [(10, 16)]
+    assert analysis.loops_with_output() == [16]
+
+
+@pytest.mark.parametrize(
+    'prog_str, data', [
+        # A jump that is never taken, and one that always is.
+        ('1105,0,7,1106,0,8,99,1,99', [(6, 8)]),
+        # Jumps off the end of the program.
+        ('1105,1,100', []),
+        # An invalid opcode after a halt.
+        ('99,98,1,1', [(1, 4)]),
+    ]
+)
+def test_data(prog_str: str, data: List[Tuple[int, int]]) -> None:
+    analysis = analyze(str_to_prog(prog_str))
+    assert analysis.data == data
+    assert analysis.disassemble()
@@ -0,0 +1,166 @@
+from collections import deque
+from itertools import chain
+from typing import Deque, List, Iterable, Iterator, Optional
+
+from .vm import Intcode, str_to_prog, values
+
+
+class AsciiChannel:
+    """Text input and output for an Intcode program that talks in ASCII.
+
+    Strings sent to the program are queued up in `pending`, and the VM reads
+    them straight from their encoded bytes once it has read everything before
+    them. The VM runs until it halts or needs input, and its output is added to
+    a bytearray in bulk and split into lines, or at `prompt` when a line starts
+    with it, which some programs print right before asking for input. Outputs
+    that aren't ASCII, like the answers at the end of day 17 and 21, are kept
+    in `values`.
+    """
+    vm: Intcode
+    prompt: Optional[bytes]
+    pending: Iterator[str]
+    buffer: bytearray
+    ready: Deque[str]
+    values: List[int]
+    after_prompt: bool
+
+    def __init__(self, vm: Intcode, prompt: Optional[str] = None):
+        self.vm = vm
+        self.prompt = None if prompt is None else prompt.encode()
+        self.pending = iter(())
+        self.buffer = bytearray()
+        self.ready = deque()
+        self.values = []
+        self.after_prompt = False
+
+    def send(self, text: str) -> None:
+        self.pending = chain(self.pending, [text])
+
+    def send_from(self, texts: Iterable[str]) -> None:
+        """Queues up strings from `texts`, only taking them as they're read."""
+        self.pending = chain(self.pending, texts)
+
+    def fork(self) -> 'AsciiChannel':
+        """Returns a channel to a fork of the VM, without the pending input."""
+        clone = AsciiChannel(self.vm.fork(()))
+        clone.prompt = self.prompt
+        clone.buffer = bytearray(self.buffer)
+        clone.ready = deque(self.ready)
+        clone.after_prompt = self.after_prompt
+        return clone
+
+    def receive(self, outputs: List[int]) -> None:
+        """Adds outputs of the VM to the buffer.
+
+        The lines they complete are moved to `ready`.
+        """
+        try:
+            data = bytes(outputs)
+            if not data.isascii():
+                raise ValueError
+        except ValueError:
+            data = bytes(value for value in outputs if 0 <= value < 128)
+            self.values.extend(value for value in outputs
+                               if not 0 <= value < 128)
+
+        buffer = self.buffer
+        buffer += data
+        prompt = self.prompt
+        ready = self.ready
+        start = 0
+        while start < len(buffer):
+            if self.after_prompt:
+                # The newline after a prompt doesn't end another line.
+                self.after_prompt = False
+                if buffer[start] == 10:
+                    start += 1
+                    continue
+            if prompt and buffer.startswith(prompt, start):
+                ready.append(prompt.decode())
+                start += len(prompt)
+                self.after_prompt = True
+                continue
+            end = buffer.find(b'\n', start)
+            if end == -1:
+                break
+            ready.append(buffer[start:end].decode())
+            start = end + 1
+        del buffer[:start]
+
+    def lines(self) -> Iterator[str]:
+        """Runs the VM, yielding every line it outputs without the newline.
+
+        The prompt is yielded as a line of its own, even if no newline follows
+        it. A partial line is yielded when the VM halts, or needs input when
+        there is none pending.
+        """
+        vm = self.vm
+        ready = self.ready
+        while True:
+            while ready:
+                yield ready.popleft()
+            if vm.halted:
+                break
+            outputs = values(vm.execute())
+            if outputs:
+                self.receive(outputs)
+                continue
+            text = next(self.pending, None)
+            if text is None:
+                break
+            vm.inputs = iter(text.encode())
+
+        if self.buffer:
+            line = self.buffer.decode()
+            self.buffer.clear()
+            yield line
+
+    def read(self) -> str:
+        """Returns the output up to and including the next prompt.
+
+        Or up to where the VM stops, without one.
+        """
+        lines = []
+        prompt = None if self.prompt is None else self.prompt.decode()
+        for line in self.lines():
+            lines.append(line)
+            if line == prompt:
+                break
+        return '\n'.join(lines)
+
+
+def test_lines() -> None:
+    # Outputs "ab\nc?" followed by 1000, then reads a line and outputs it back.
+    prog = str_to_prog('104,97,104,98,104,10,104,99,104,63,104,1000,'
+                       '3,100,4,100,1008,100,10,101,1006,101,12,99')
+    channel = AsciiChannel(Intcode(prog), 'c?')
+    assert list(channel.lines()) == ['ab', 'c?']
+    assert channel.values == [1000]
+    assert channel.vm.needs_input
+
+    clone = channel.fork()
+    channel.send('hi\n')
+    assert channel.read() == 'hi'
+    assert channel.vm.halted
+
+    clone.send_from(iter(['x', 'y\n']))
+    assert list(clone.lines()) == ['xy']
+
+
+def test_pending_is_read_lazily() -> None:
+    # Outputs "x?\ny\n", then outputs every character it reads.
+    prog = str_to_prog('104,120,104,63,104,10,104,121,104,10,'
+                       '3,100,4,100,1105,1,10')
+    channel = AsciiChannel(Intcode(prog), 'x?')
+    sent = []
+
+    def texts() -> Iterator[str]:
+        for text in ['1', '2\n']:
+            sent.append(text)
+            yield text
+
+    channel.send_from(texts())
+    assert channel.read() == 'x?'
+    assert sent == []
+    assert channel.read() == 'y\n12'
+    assert sent == ['1', '2\n']
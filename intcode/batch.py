@@ -0,0 +1,64 @@
+from multiprocessing import Pool
+from typing import List, Optional, Sequence, Type
+
+import pytest
+
+from .vm import Intcode, Program, Snapshot, str_to_prog
+from .compiled import CompiledIntcode
+
+# Chunks per process, so that a slow chunk doesn't hold up the whole batch.
+CHUNKS_PER_PROCESS = 4
+
+# VM that runs are forked from in a pool process. Compiled code can't be
+# pickled, so every process sets up its own.
+worker_start: Optional[Snapshot] = None
+
+
+def run_chunk(start: Snapshot,
+              batch: Sequence[Sequence[int]]) -> List[List[int]]:
+    return [start.fork(inputs).run() for inputs in batch]
+
+
+def init_worker(prog: Program, backend: Type[Intcode]) -> None:
+    global worker_start
+    worker_start = backend(prog).snapshot()
+
+
+def run_worker_chunk(batch: Sequence[Sequence[int]]) -> List[List[int]]:
+    assert worker_start is not None
+    return run_chunk(worker_start, batch)
+
+
+def run_batch(prog: Program, batch: Sequence[Sequence[int]],
+              backend: Type[Intcode] = CompiledIntcode,
+              processes: Optional[int] = None) -> List[List[int]]:
+    """Runs `prog` once for every sequence of inputs.
+
+    Returns the outputs of every run, in order.
+
+    Every run is a fork of the same VM, so the program is only loaded, decoded
+    or compiled once. With `processes`, the runs are split up over a pool of
+    that many processes.
+    """
+    if not processes or processes <= 1:
+        return run_chunk(backend(prog).snapshot(), batch)
+
+    size = max(1, -(-len(batch) // (processes * CHUNKS_PER_PROCESS)))
+    chunks = [batch[i:i + size] for i in range(0, len(batch), size)]
+    with Pool(processes, init_worker, (prog, backend)) as pool:
+        results = pool.map(run_worker_chunk, chunks)
+    return [outputs for result in results for outputs in result]
+
+
+# Outputs 1 if its two inputs add up to more than 10, otherwise 0.
+TEST_PROG = '3,20,3,21,1,20,21,22,1007,22,11,23,1008,23,0,23,4,23,99'
+
+
+@pytest.mark.parametrize('backend', [Intcode, CompiledIntcode])
+@pytest.mark.parametrize('processes', [None, 2])
+def test_run_batch(backend: Type[Intcode], processes: Optional[int]) -> None:
+    prog = str_to_prog(TEST_PROG)
+    batch = [(x, y) for x in range(10) for y in range(10)]
+    expected = [backend(prog, inputs).run() for inputs in batch]
+    assert run_batch(prog, batch, backend, processes) == expected
+    assert expected[-1] == [1] and expected[0] == [0]
@@ -0,0 +1,285 @@
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import weakref
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from .vm import Intcode, str_to_prog
+from .decoded import DecodedIntcode
+from .compiled import CompiledIntcode
+from .typed import TypedIntcode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Days whose solutions run Intcode programs.
+DAYS = ['05', '07', '09', '11', '13', '15', '17', '19', '21', '23', '25']
+
+BACKENDS: Dict[str, Type[Intcode]] = {
+    'Intcode': Intcode,
+    'DecodedIntcode': DecodedIntcode,
+    'CompiledIntcode': CompiledIntcode,
+    'TypedIntcode': TypedIntcode,
+}
+
+# Names in the drivers of classes that create their VMs from a `backend`
+# argument.
+FACTORIES = ('AsyncIntcode', 'Network', 'ShardedNetwork')
+
+Result = Dict[str, Any]
+
+
+def workloads(days: List[str] = DAYS) -> List[Tuple[str, str]]:
+    """Every day and part with a driver, like ('05', 'part1')."""
+    found = []
+    for day in days:
+        for name in sorted(os.listdir(os.path.join(ROOT, 'day' + day))):
+            if name.startswith('part') and name.endswith('.py'):
+                found.append((day, name[:-3]))
+    return found
+
+
+def counting(backend: Type[Intcode]) -> Type[Intcode]:
+    """Subclass of `backend` counting the instructions of every VM it makes.
+
+    Forks are counted too, from the instructions they had executed when
+    created, since they start out with the count of the VM they were forked
+    from. Only weak references to the VMs are kept, so that they are freed like
+    they would be otherwise, and the count of a VM is added to `freed` when it
+    is. See `instructions`.
+    """
+    class Counted(backend):  # type: ignore
+        created = 0
+        freed = 0
+        live: 'weakref.WeakSet[Intcode]' = weakref.WeakSet()
+
+        def __init__(self, *args, **kwargs):
+            self.counted_from = 0
+            super().__init__(*args, **kwargs)
+            Counted.created += 1
+            Counted.live.add(self)
+
+        def copy_state(self, clone):
+            super().copy_state(clone)
+            clone.counted_from = clone.instructions
+            Counted.created += 1
+            Counted.live.add(clone)
+
+        def __del__(self):
+            Counted.freed += self.instructions - self.counted_from
+
+    Counted.__name__ = backend.__name__
+    return Counted
+
+
+def instructions(counted: Any) -> Optional[int]:
+    """Instructions executed by the VMs of a `counting` backend.
+
+    None if there were no VMs.
+    """
+    if not counted.created:
+        return None
+    # Held on to while adding them up, so that none of them is freed and
+    # counted twice.
+    live = list(counted.live)
+    return counted.freed + sum(
+        vm.instructions - vm.counted_from for vm in live)
+
+
+def run_workload(day: str, part: str, backend_name: str) -> Result:
+    """Runs the driver of a day's part, with all of its VMs of `backend_name`.
+
+    The driver's output is swallowed, and its last line kept as the answer.
+    Drivers that don't create their VMs themselves, like day 19 part 1 running
+    them on NumPy arrays, are still timed, but don't count instructions.
+    """
+    path = os.path.join(ROOT, 'day' + day, part + '.py')
+    spec = importlib.util.spec_from_file_location(
+        'day{}_{}'.format(day, part), path)
+    assert spec is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)  # type: ignore
+
+    backend = counting(BACKENDS[backend_name])
+    for name, value in list(vars(module).items()):
+        if isinstance(value, type) and issubclass(value, Intcode):
+            setattr(module, name, backend)
+        elif name in FACTORIES:
+            setattr(module, name, partial(value, backend=backend))
+
+    cwd = os.getcwd()
+    os.chdir(os.path.dirname(path))
+    try:
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            start = time.perf_counter()
+            module.main()  # type: ignore
+            wall_time = time.perf_counter() - start
+    finally:
+        os.chdir(cwd)
+
+    executed = instructions(backend)
+    lines = out.getvalue().strip().splitlines()
+    return {
+        'day': day,
+        'part': part,
+        'backend': backend_name,
+        'answer': lines[-1] if lines else '',
+        'wall_time': wall_time,
+        'instructions': executed,
+        'instructions_per_sec': executed / wall_time if executed else None,
+        # Kilobytes on Linux, and for the whole process, Python itself
+        # included.
+        'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run_isolated(day: str, part: str, backend_name: str,
+                 timeout: Optional[float]) -> Result:
+    """Runs a workload in a process of its own, for a peak RSS of its own."""
+    try:
+        proc = subprocess.run(
+            [sys.executable, '-m', 'intcode.bench', '--run', day, part,
+             backend_name],
+            cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            timeout=timeout, check=True, universal_newlines=True)
+    except subprocess.TimeoutExpired:
+        return {'day': day, 'part': part, 'backend': backend_name,
+                'error': 'timeout'}
+    except subprocess.CalledProcessError as e:
+        error = e.stderr.strip().splitlines()
+        return {'day': day, 'part': part, 'backend': backend_name,
+                'error': (error[-1] if error
+                          else 'exit code {}'.format(e.returncode))}
+    return json.loads(proc.stdout)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT,
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=True,
+                              universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def mismatches(results: List[Result]) -> List[str]:
+    """Workloads for which the backends didn't all give the same answer."""
+    answers: Dict[Tuple[str, str], Dict[str, str]] = {}
+    for result in results:
+        if 'answer' in result:
+            key = (result['day'], result['part'])
+            answers.setdefault(key, {})[result['backend']] = result['answer']
+    return ['day{} {}: {}'.format(day, part, answers[day, part])
+            for day, part in sorted(answers)
+            if len(set(answers[day, part].values())) > 1]
+
+
+def compare(old: List[Result], new: List[Result]) -> str:
+    """Report of how the wall time and answer of every workload changed."""
+    before = {(r['day'], r['part'], r['backend']): r for r in old}
+    lines = []
+    for result in new:
+        key = (result['day'], result['part'], result['backend'])
+        if key not in before:
+            continue
+        prev = before[key]
+        label = 'day{} {:<6} {:<16}'.format(*key)
+        if 'error' in result or 'error' in prev:
+            lines.append('{} {} -> {}'.format(
+                label, prev.get('error', 'ok'), result.get('error', 'ok')))
+            continue
+        change = result['wall_time'] / prev['wall_time'] - 1
+        answer = ''
+        if result['answer'] != prev['answer']:
+            answer = '  ANSWER CHANGED'
+        lines.append('{} {:8.3f}s -> {:8.3f}s {:+7.1%}{}'.format(
+            label, prev['wall_time'], result['wall_time'], change, answer))
+    return '\n'.join(lines)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description='Runs the Intcode days headless on every backend, and '
+                    'records how they do.')
+    parser.add_argument('--days', nargs='+', default=DAYS)
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS),
+                        choices=list(BACKENDS))
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='seconds a single workload may take')
+    parser.add_argument('--output', '-o',
+                        help='file to write the results to, as JSON')
+    parser.add_argument('--compare',
+                        help='results of an earlier run to compare with')
+    parser.add_argument('--run', nargs=3, metavar=('DAY', 'PART', 'BACKEND'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_workload(*args.run)))
+        return 0
+
+    results = []
+    for day, part in workloads(args.days):
+        for backend_name in args.backends:
+            result = run_isolated(day, part, backend_name, args.timeout)
+            results.append(result)
+            if 'error' in result:
+                print('day{} {:<6} {:<16} {}'.format(
+                    day, part, backend_name, result['error']))
+            else:
+                rate = result['instructions_per_sec']
+                print('day{} {:<6} {:<16} {:8.3f}s {:>12} {:>8} KB'.format(
+                    day, part, backend_name, result['wall_time'],
+                    '-' if rate is None else '{:,.0f}/s'.format(rate),
+                    result['peak_rss']))
+
+    bad = mismatches(results)
+    for line in bad:
+        print('answers differ for', line)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            print(compare(json.load(f)['results'], results))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'commit': git_commit(),
+                       'python': sys.version.split()[0],
+                       'results': results}, f, indent=2)
+    return 1 if bad else 0
+
+
+def test_counting() -> None:
+    counted = counting(Intcode)
+    prog = str_to_prog('104,1,104,2,99')
+    for _ in range(3):
+        counted(prog).run()
+    vm = counted(prog)
+    assert vm.feed([]) == 1
+    clone = vm.fork()
+    assert clone.run() == [2]
+    # Three instructions for each of the VMs that ran to the end, which are
+    # gone by now.
+    assert instructions(counted) == 3 * 3 + 1 + 2
+    assert set(counted.live) == {vm, clone}  # type: ignore
+
+
+def test_run_workload() -> None:
+    results = [run_workload('09', 'part1', name)
+               for name in ['Intcode', 'CompiledIntcode']]
+    assert results[0]['answer'] == results[1]['answer'] != ''
+    assert results[0]['instructions'] == results[1]['instructions'] > 0
+    assert mismatches(results) == []
+    report = compare(results, results)
+    assert all('+0.0%' in line for line in report.splitlines())
+
+
+if __name__ == '__main__':
+    exit(main())
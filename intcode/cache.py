@@ -0,0 +1,72 @@
+import hashlib
+import os
+import tempfile
+from array import array
+from typing import List, Iterable, Optional
+
+# Where parsed programs and decoded instructions are kept between runs. The
+# cache is off unless this is set, for example to ~/.cache/intcode.
+CACHE_DIR = os.environ.get('INTCODE_CACHE_DIR', '')
+
+# Part of every entry's name, and bumped whenever the layout of an entry
+# changes, like the opcodes of superinstructions in decoded tables, so that
+# older entries are never read.
+FORMAT_VERSION = 1
+
+# Programs shorter than this many characters are parsed faster than they are
+# looked up.
+MIN_CACHED_SIZE = 4096
+
+
+def cache_key(text: str) -> str:
+    return hashlib.sha256(text.strip().encode()).hexdigest()
+
+
+def cache_path(key: str, kind: str) -> str:
+    name = '{}.{}.v{}'.format(key, kind, FORMAT_VERSION)
+    return os.path.join(CACHE_DIR, name)
+
+
+def load_words(key: str, kind: str, width: int = 1) -> Optional[List]:
+    """Reads an array of 64-bit words from the cache.
+
+    With `width`, the words are returned as rows of that many. Returns None if
+    there is no such entry.
+    """
+    if not CACHE_DIR:
+        return None
+    words = array('q')
+    try:
+        with open(cache_path(key, kind), 'rb') as f:
+            words.frombytes(f.read())
+    except (OSError, ValueError):
+        # Missing, or truncated mid-word.
+        return None
+    if not words or len(words) % width:
+        # Empty, or truncated mid-row.
+        return None
+    if width == 1:
+        return words.tolist()
+    return [words[i:i + width].tolist() for i in range(0, len(words), width)]
+
+
+def save_words(key: str, kind: str, words: Iterable[int]) -> bool:
+    """Writes an array of 64-bit words to the cache, returning if it could."""
+    if not CACHE_DIR:
+        return False
+    try:
+        data = array('q', words)
+    except OverflowError:
+        return False
+
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Written next to the entry and then renamed, so that nobody reads half
+        # of it.
+        fd, tmp = tempfile.mkstemp(dir=CACHE_DIR)
+        with os.fdopen(fd, 'wb') as f:
+            data.tofile(f)
+        os.replace(tmp, cache_path(key, kind))
+    except OSError:
+        return False
+    return True
@@ -0,0 +1,450 @@
+import sys
+from typing import (
+    Any, List, Dict, Set, Iterable, Optional, Callable, Tuple, Union,
+)
+
+from .dispatch import SharedCache, SharedImage, add_owner, interpret, suspend
+from .vm import (
+    Intcode, Program, Snapshot, ARITY, MAX_DENSE_GROWTH, str_to_prog,
+)
+
+# Takes memory, the relative base, owners and the invalidation callback, and
+# returns the next pc, the relative base, the number of instructions executed
+# and the value output by the block's last instruction, if it's an output.
+Block = Callable[[Program, int, list, Callable[[int], None]],
+                 Tuple[int, int, int, Optional[int]]]
+
+# Marks a pc that is executed one instruction at a time instead of through a
+# block.
+INTERPRET = 'interpret'
+
+# Longest block that is compiled, in instructions.
+MAX_BLOCK_LENGTH = 64
+
+# Times a block may be overwritten and recompiled before it's interpreted
+# instead.
+MAX_RECOMPILES = 3
+
+# Words of a block, with None for operands that are read from memory when the
+# block runs.
+Words = Tuple[Optional[int], ...]
+
+# Compiled blocks and the memory size they need, shared between VMs, keyed by
+# start pc and the words they were made from.
+BLOCK_CACHE: Dict[Tuple[int, Words], Tuple[Block, int]] = {}
+BLOCK_CACHE_SIZE = 4096
+
+
+class MemoryFault(Exception):
+    def __init__(self, pc: int, rel_base: int):
+        super().__init__(pc, rel_base)
+        self.pc = pc
+        self.rel_base = rel_base
+
+
+def find_jump_targets(prog: Program) -> Set[int]:
+    """Linear sweep over the program, collecting immediate jump targets."""
+    targets = set()
+    pc = 0
+    while pc < len(prog):
+        instr = prog[pc]
+        opc = instr % 100
+        if opc not in ARITY:
+            pc += 1
+            continue
+        if ((opc == 5 or opc == 6) and instr // 1000 % 10 == 1 and
+                pc + 2 < len(prog)):
+            targets.add(prog[pc + 2])
+        pc += ARITY[opc] + 1
+    return targets
+
+
+class SharedCode(SharedImage):
+    """Blocks compiled from the unmodified words of a program.
+
+    They are shared by all VMs running it.
+
+    New VMs start out with a copy of these, so a program that is run over and
+    over only gets compiled once.
+    """
+    targets: Set[int]
+    dynamic: Set[int]
+    blocks: List[Union[None, str, Block]]
+    size: int
+
+    def __init__(self, image: Tuple[int, ...],
+                 targets: Optional[Set[int]] = None):
+        super().__init__(image)
+        if targets is None:
+            targets = find_jump_targets(list(image))
+        self.targets = targets
+        # Operand words the program has been seen writing to.
+        self.dynamic = set()
+        self.blocks = [None] * len(image)
+        # Memory needed by the static addresses used in the blocks.
+        self.size = len(image)
+
+
+SHARED_CODE: SharedCache[Tuple[int, ...], SharedCode] = SharedCache(SharedCode)
+
+
+def translate(start: int, words: Words) -> Tuple[str, int]:
+    """Returns the source of the function for a block, and its memory size."""
+    size = 0
+
+    def operand(addr: int, mode: int) -> str:
+        nonlocal size
+        word = words[addr - start]
+        if word is None:
+            value = 'm[{}]'.format(addr)
+        elif mode == 0:
+            size = max(size, word + 1)
+            return 'm[{}]'.format(word)
+        else:
+            value = '({})'.format(word)
+
+        if mode == 0:
+            return 'm[{}]'.format(value)
+        if mode == 2:
+            return 'm[rb + {}]'.format(value)
+        return value
+
+    body = []
+    pc = start
+    end = start + len(words)
+    count = 0
+    while pc < end:
+        instr = words[pc - start]
+        assert instr is not None
+        opc = instr % 100
+        arity = ARITY[opc]
+        modes = [instr // 100 % 10, instr // 1000 % 10, instr // 10000 % 10]
+        nxt = pc + arity + 1
+
+        # Instructions with computed addresses remember their pc, in case
+        # memory needs to grow.
+        if any(modes[i] == 2 or words[pc + 1 + i - start] is None
+               for i in range(arity)):
+            body.append('p = {}'.format(pc))
+        count += 1
+
+        a = operand(pc + 1, modes[0])
+        if opc == 9:
+            body.append('rb += {}'.format(a))
+        elif opc == 5 or opc == 6:
+            b = operand(pc + 2, modes[1])
+            cond = a if opc == 5 else 'not {}'.format(a)
+            body.append('return ({} if {} else {}), rb, {}, None'.format(
+                b, cond, nxt, count))
+        elif opc == 4:
+            body.append('return {}, rb, {}, {}'.format(nxt, count, a))
+        else:
+            b = operand(pc + 2, modes[1])
+            expr = {
+                1: '{} + {}',
+                2: '{} * {}',
+                7: '1 if {} < {} else 0',
+                8: '1 if {} == {} else 0',
+            }[opc].format(a, b)
+
+            # The write address, unlike other operands, isn't read from memory.
+            c = words[pc + 3 - start]
+            if c is None:
+                target = 'm[{}]'.format(pc + 3)
+            else:
+                target = str(c)
+            if modes[2] == 2:
+                target = 'rb + {}'.format(target)
+            elif c is not None:
+                size = max(size, c + 1)
+            if c is not None and modes[2] != 2:
+                body.append('m[{}] = {}'.format(target, expr))
+            else:
+                body.append('t = {}'.format(target))
+                body.append('m[t] = {}'.format(expr))
+                target = 't'
+            body.append('if o[{}] is not None:'.format(target))
+            body.append('    inv({})'.format(target))
+            body.append('    return {}, rb, {}, None'.format(nxt, count))
+        pc = nxt
+
+    if not body[-1].startswith('return'):
+        body.append('return {}, rb, {}, None'.format(end, count))
+
+    src = 'def block(m, rb, o, inv):\n    p = {}\n    try:\n'.format(start)
+    src += ''.join('        {}\n'.format(line) for line in body)
+    src += '    except IndexError:\n        raise MemoryFault(p, rb)\n'
+    return src, size
+
+
+class CompiledIntcode(Intcode):
+    """Intcode VM that translates basic blocks into Python functions.
+
+    A block starts at whatever pc execution reaches, and runs until a jump, an
+    input, a halt or the start of another block (any immediate jump target). An
+    output ends a block too, and the block returns its value, so that the
+    arithmetic leading up to every character of ASCII programs runs in one
+    call. The generated function keeps the relative base in a local and works
+    directly on memory.
+
+    A write into the words of a compiled block throws the block away. Operands
+    that have been overwritten once are read from memory when the block is
+    compiled again, which keeps self-modifying idioms like computed returns
+    compiled. Blocks whose opcodes keep being overwritten are interpreted one
+    instruction at a time instead.
+    """
+    shared: SharedCode
+    blocks: List[Union[None, str, Block]]
+    owners: List[Optional[List[int]]]
+    recompiles: Dict[int, int]
+    targets: Set[int]
+    dynamic: Set[int]
+
+    def __init__(self, prog: Program, inputs: Iterable[int] = ()):
+        super().__init__(prog, inputs)
+        self.shared = SHARED_CODE.get(tuple(prog))
+        self.blocks = self.shared.blocks[:]
+        self.owners = self.shared.owners[:]
+        self.recompiles = {}
+        self.targets = self.shared.targets
+        self.dynamic = self.shared.dynamic
+        if self.shared.size > len(self.prog):
+            self.extend(self.shared.size)
+
+    def extend(self, size: int) -> None:
+        super().extend(size)
+        missing = len(self.prog) - len(self.blocks)
+        self.blocks.extend([None] * missing)
+        self.owners.extend([None] * missing)
+        # Later VMs are likely to need as much, so they start out with it.
+        self.shared.size = max(self.shared.size, len(self.prog))
+
+    def written(self, addr: int) -> None:
+        if self.owners[addr] is not None:
+            self.invalidate(addr)
+
+    def copy_state(self, clone: Intcode) -> None:
+        super().copy_state(clone)
+        assert isinstance(clone, CompiledIntcode)
+        clone.blocks = self.blocks[:]
+        clone.owners = self.owners[:]
+        clone.recompiles = dict(self.recompiles)
+
+    def snapshot(self) -> Snapshot:
+        snapshot = super().snapshot()
+        vm = snapshot.vm
+        assert isinstance(vm, CompiledIntcode)
+        # Forks of the snapshot share the blocks compiled for its memory, the
+        # same way VMs running the same program do. The snapshot's VM never
+        # runs, so it holds them.
+        shared = SharedCode(tuple(vm.prog), self.targets)
+        shared.dynamic = self.dynamic
+        shared.blocks = vm.blocks
+        shared.owners = vm.owners
+        vm.shared = shared
+        return snapshot
+
+    def invalidate(self, addr: int) -> None:
+        blocks = self.blocks
+        shared = self.shared
+        self.dynamic.add(addr)
+
+        # Blocks compiled before the word was known to be dynamic are dropped
+        # for later VMs too, so that they get the recompiled version instead.
+        if addr < len(shared.owners) and shared.owners[addr] is not None:
+            for pc in shared.owners[addr]:  # type: ignore
+                if shared.blocks[pc] is not INTERPRET:
+                    shared.blocks[pc] = None
+            shared.owners[addr] = None
+
+        for pc in self.owners[addr] or []:
+            block = blocks[pc]
+            if block is None or block is INTERPRET:
+                continue
+
+            count = self.recompiles.get(pc, 0) + 1
+            self.recompiles[pc] = count
+            if count > MAX_RECOMPILES:
+                # Interpreting is always correct, so later VMs can skip
+                # straight to it.
+                blocks[pc] = INTERPRET
+                if pc < len(shared.blocks):
+                    shared.blocks[pc] = INTERPRET
+            else:
+                blocks[pc] = None
+        self.owners[addr] = None
+
+    def scan(self, start: int) -> List[int]:
+        """Returns the pc of every instruction in the block at `start`."""
+        prog = self.prog
+        pcs: List[int] = []
+        pc = start
+        while len(pcs) < MAX_BLOCK_LENGTH:
+            if pc >= len(prog) or (pc != start and pc in self.targets):
+                break
+            opc = prog[pc] % 100
+            if opc not in ARITY or opc == 3 or opc == 99:
+                break
+            if pc + ARITY[opc] >= len(prog):
+                break
+            pcs.append(pc)
+            pc += ARITY[opc] + 1
+            if opc == 4 or opc == 5 or opc == 6:
+                break
+        return pcs
+
+    def compile(self, start: int) -> Union[str, Block]:
+        """Compiles the block at `start`, or returns INTERPRET if empty."""
+        prog = self.prog
+        shared = self.shared
+        dynamic = self.dynamic
+
+        pcs = self.scan(start)
+        if not pcs:
+            image = shared.image
+            if start < len(image) and prog[start] == image[start]:
+                shared.blocks[start] = INTERPRET
+            return INTERPRET
+
+        words: List[Optional[int]] = []
+        for pc in pcs:
+            words.append(prog[pc])
+            for addr in range(pc + 1, pc + 1 + ARITY[prog[pc] % 100]):
+                words.append(None if addr in dynamic else prog[addr])
+
+        key = (start, tuple(words))
+        cached = BLOCK_CACHE.get(key)
+        if cached is None:
+            src, size = translate(start, key[1])
+            namespace: Dict[str, Any] = {'MemoryFault': MemoryFault}
+            name = '<intcode block {}>'.format(start)
+            exec(compile(src, name, 'exec'), namespace)
+            if len(BLOCK_CACHE) >= BLOCK_CACHE_SIZE:
+                BLOCK_CACHE.clear()
+            cached = BLOCK_CACHE[key] = (namespace['block'], size)
+        fn, size = cached
+
+        if size > len(prog):
+            if size - len(prog) > MAX_DENSE_GROWTH:
+                # Far addresses are sparse, which only the interpreter handles.
+                return INTERPRET
+            self.extend(size)
+        owned = [start + i for i, word in enumerate(words) if word is not None]
+        add_owner(self.owners, start, owned)
+        if shared.unmodified(prog, owned):
+            shared.blocks[start] = fn
+            add_owner(shared.owners, start, owned)
+            shared.size = max(shared.size, size)
+        return fn
+
+    def execute(self, max_outputs: Optional[int] = None,
+                yield_on_input: bool = False,
+                budget: Optional[int] = None) -> List[Optional[int]]:
+        prog = self.prog
+        blocks = self.blocks
+        owners = self.owners
+        invalidate = self.invalidate
+        pc = self.pc
+        rel_base = self.rel_base
+        executed = self.instructions
+        outputs: List[Optional[int]] = []
+        limit = sys.maxsize if budget is None else executed + budget
+
+        while True:
+            executed += 1
+            try:
+                block = blocks[pc]
+                if block is None:
+                    block = blocks[pc] = self.compile(pc)
+
+                if block is not INTERPRET:
+                    try:
+                        pc, rel_base, n, output = block(  # type: ignore
+                            prog, rel_base, owners, invalidate)
+                        executed += n - 1
+                        if output is not None:
+                            self.output = output
+                            outputs.append(output)
+                            if len(outputs) == max_outputs:
+                                return suspend(self, pc, rel_base, executed,
+                                               outputs)
+                        elif executed >= limit:
+                            break
+                    except MemoryFault as e:
+                        # Only the instructions before the faulting one have
+                        # been executed.
+                        done = [addr for addr in self.scan(pc) if addr < e.pc]
+                        state = interpret(
+                            self, e.pc, e.rel_base, executed + len(done),
+                            outputs, max_outputs, yield_on_input, fault=True)
+                        if state is None:
+                            return outputs
+                        pc, rel_base, executed = state
+                    continue
+
+                # I/O, halts and blocks that couldn't be compiled, one
+                # instruction at a time.
+                opc = prog[pc] % 100
+                state = interpret(self, pc, rel_base, executed, outputs,
+                                  max_outputs, yield_on_input)
+                if state is None:
+                    return outputs
+                pc, rel_base, executed = state
+                if (opc == 5 or opc == 6) and executed >= limit:
+                    break
+            except IndexError:
+                state = interpret(self, pc, rel_base, executed, outputs,
+                                  max_outputs, yield_on_input, fault=True)
+                if state is None:
+                    return outputs
+                pc, rel_base, executed = state
+
+        # Out of budget, which is only checked at jumps and after blocks that
+        # don't output.
+        return suspend(self, pc, rel_base, executed, outputs)
+
+
+def test_block_overwriting_itself_falls_back_to_interpreter() -> None:
+    # The instruction at 0 writes to its own opcode, so its block is
+    # overwritten every loop.
+    prog = str_to_prog('1001,0,1,0,1001,20,-1,20,1005,20,0,4,0,99,'
+                       '0,0,0,0,0,0,10')
+    intc = CompiledIntcode(prog)
+    assert intc.run() == Intcode(prog).run() == [1002]
+    assert intc.blocks[0] is INTERPRET
+
+
+def test_block_growing_memory() -> None:
+    prog = str_to_prog('109,1000,21101,2,3,0,22201,0,0,1,204,1,99')
+    assert CompiledIntcode(prog).run() == [10]
+
+
+def test_fork() -> None:
+    prog = str_to_prog('104,0,1001,1,1,1,1001,17,-1,17,1005,17,0,99,0,0,0,3')
+    intc = CompiledIntcode(prog)
+    assert intc.feed([], 2) == [0, 1]
+    snapshot = intc.snapshot()
+    assert intc.run() == [2]
+    assert snapshot.fork().run() == snapshot.fork().run() == [2]
+
+
+def test_computed_return_stays_compiled() -> None:
+    # Calls the subroutine at 11 twice, storing the return address into the
+    # jump at 17.
+    prog = str_to_prog('1101,0,7,19,1105,1,11,1101,0,21,19,'
+                       '1001,22,1,22,4,22,1105,1,0,0,99,0')
+    intc = CompiledIntcode(prog)
+    assert intc.run() == Intcode(prog).run() == [1, 2]
+    assert intc.recompiles.get(17, 0) <= 1
+
+
+def test_output_ends_block() -> None:
+    # Counts down from 3, outputting twice the counter from the same block as
+    # the arithmetic.
+    prog = str_to_prog('1001,20,-1,20,1002,20,2,21,4,21,1005,20,0,99,'
+                       '0,0,0,0,0,0,3,0')
+    intc = CompiledIntcode(prog)
+    assert intc.feed([], 2) == [4, 2]
+    assert intc.blocks[0] is not INTERPRET
+    assert (intc.pc, intc.instructions) == (10, 7)
+    assert intc.run() == [0]
@@ -0,0 +1,115 @@
+import os
+from typing import Callable, Iterable, Iterator, List
+
+import pytest
+
+from .vm import Intcode, Program, str_to_prog
+from .decoded import DecodedIntcode
+from .compiled import CompiledIntcode
+from .typed import TypedIntcode
+from .profiler import ProfiledIntcode
+from .trace import TraceWriter, TracedIntcode
+
+# Makes a VM of some backend for a program and its inputs.
+Backend = Callable[[Program, Iterable[int]], Intcode]
+
+# Every backend, tested for behaving exactly like `Intcode` here. Traced VMs
+# trace to nowhere, either inputs and outputs only or every step.
+BACKENDS = ['Intcode', 'DecodedIntcode', 'CompiledIntcode', 'TypedIntcode',
+            'ProfiledIntcode', 'TracedIntcode', 'TracedIntcode-steps']
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request) -> Iterator[Backend]:
+    writers: List[TraceWriter] = []
+
+    def make(prog: Program, inputs: Iterable[int] = ()) -> Intcode:
+        if request.param.startswith('TracedIntcode'):
+            steps = request.param.endswith('-steps')
+            writers.append(TraceWriter(os.devnull, prog, steps))
+            return TracedIntcode(prog, writers[-1], inputs)
+        return {
+            'Intcode': Intcode,
+            'DecodedIntcode': DecodedIntcode,
+            'CompiledIntcode': CompiledIntcode,
+            'TypedIntcode': TypedIntcode,
+            'ProfiledIntcode': ProfiledIntcode,
+        }[request.param](prog, inputs)
+
+    yield make
+    for writer in writers:
+        writer.close()
+
+
+@pytest.mark.parametrize(
+    'prog_str, inputs, expected', [
+        ('3,9,8,9,10,9,4,9,99,-1,8', [8], [1]),
+        ('3,9,8,9,10,9,4,9,99,-1,8', [7], [0]),
+        ('3,3,1107,-1,8,3,4,3,99', [5], [1]),
+        ('3,12,6,12,15,1,13,14,13,4,13,99,-1,0,1,9', [0], [0]),
+        ('3,3,1105,-1,9,1101,0,0,12,4,12,99,1', [99], [1]),
+        ('109,1,204,-1,1001,100,1,100,1008,100,16,101,1006,101,0,99', [],
+            [109, 1, 204, -1, 1001, 100, 1, 100, 1008, 100, 16, 101, 1006, 101,
+             0, 99]),
+        ('1102,34915192,34915192,7,4,7,99,0', [], [1219070632396864]),
+        ('104,1125899906842624,99', [], [1125899906842624]),
+    ]
+)
+def test_compute(backend: Backend, prog_str: str, inputs: List[int],
+                 expected: List[int]) -> None:
+    assert backend(str_to_prog(prog_str), inputs).run() == expected
+
+
+# Traces only hold 64-bit values.
+@pytest.mark.parametrize(
+    'backend',
+    [name for name in BACKENDS if not name.startswith('TracedIntcode')],
+    indirect=True)
+def test_values_past_64_bits(backend: Backend) -> None:
+    prog = str_to_prog('1102,4294967296,4294967296,7,4,7,99,0')
+    assert backend(prog, []).run() == [1 << 64]
+    assert backend(str_to_prog('3,5,4,5,99,0'), [-1 << 64]).run() == [-1 << 64]
+
+
+def test_far_addresses_are_sparse(backend: Backend) -> None:
+    prog = str_to_prog('3,1000000000,109,999999990,22201,10,10,11,204,11,'
+                       '4,123456789,99')
+    intc = backend(prog, [21])
+    assert intc.run() == [42, 0]
+    assert intc.sparse == {1000000000: 21, 1000000001: 42}
+    prog = str_to_prog('1101,20,22,1000000000,4,1000000000,99')
+    assert backend(prog, []).run() == [42]
+
+
+def test_self_modifying_program(backend: Backend) -> None:
+    # Loops three times, each time rewriting the immediate operand of the
+    # output instruction.
+    prog = str_to_prog('104,0,1001,1,1,1,1001,17,-1,17,1005,17,0,99,0,0,0,3')
+    assert backend(prog, []).run() == [0, 1, 2]
+
+
+@pytest.mark.parametrize(
+    'prog_str, inputs', [
+        ('1101,1,2,2000,4,2000,3,100,4,100,1105,1,6', []),
+        ('1101,1,2,2000,4,2000,3,100,4,100,1105,1,6', [1]),
+        ('1101,1,2,2000,4,2000,3,100,4,100,1105,1,6', [1, 2]),
+        ('109,1,204,-1,1001,100,1,100,1008,100,16,101,1006,101,0,99', []),
+        ('3,1000000000,109,999999990,22201,10,10,11,204,11,4,0,99', [2]),
+        ('104,0,1001,1,1,1,1001,17,-1,17,1005,17,0,99,0,0,0,3', []),
+    ]
+)
+def test_instructions(backend: Backend, prog_str: str,
+                      inputs: List[int]) -> None:
+    prog = str_to_prog(prog_str)
+    intc, ref = backend(prog, inputs), Intcode(prog, inputs)
+    assert intc.run() == ref.run()
+    assert (intc.pc, intc.instructions, intc.needs_input) == \
+        (ref.pc, ref.instructions, ref.needs_input)
+
+
+def test_budget(backend: Backend) -> None:
+    prog = str_to_prog('3,100,4,100,1105,1,0')
+    intc, ref = backend(prog, [1, 2, 3]), Intcode(prog, [1, 2, 3])
+    for budget in [2, 4, 1, 100]:
+        assert intc.run_for(budget) == ref.run_for(budget)
+        assert (intc.pc, intc.instructions) == (ref.pc, ref.instructions)
@@ -0,0 +1,401 @@
+import sys
+from typing import List, Dict, Iterable, Optional, Tuple
+
+from . import cache
+from .analysis import Analysis
+from .dispatch import SharedCache, SharedImage, add_owner, interpret, suspend
+from .vm import Intcode, Program, ARITY, str_to_prog
+
+# (opcode, mode a, a, mode b, b, mode c, c), unused operands are 0.
+Instruction = Tuple[int, int, int, int, int, int, int]
+
+# Opcodes of superinstructions, which execute an instruction and the jump after
+# it as one. Their opcode is one of these plus that of the first instruction.
+JUMP_IF_TRUE = 100
+JUMP_IF_FALSE = 200
+JUMP = 300
+
+
+def instruction_size(opc: int) -> int:
+    """Number of words taken by a decoded instruction or superinstruction."""
+    return ARITY[opc % 100] + 1 + (3 if opc > 99 else 0)
+
+
+class SharedDecode(SharedImage):
+    """Instructions decoded from the unmodified words of a program.
+
+    They are shared by all VMs running it.
+    """
+    code: List[Optional[Instruction]]
+    jumps: Dict[int, int]
+
+    def __init__(self, image: Tuple[int, ...]):
+        super().__init__(image)
+        self.code = [None] * len(image)
+        self.jumps = {}
+
+
+# Keyed by whether superinstructions are decoded, and the program.
+SHARED_DECODE: SharedCache[Tuple[bool, Tuple[int, ...]], SharedDecode] = \
+    SharedCache(lambda key: SharedDecode(key[1]))
+
+
+class DecodedIntcode(Intcode):
+    """Intcode VM that decodes every instruction once, when first executed.
+
+    Decoded instructions are cached per pc. A write to any word belonging to a
+    decoded instruction drops it from the cache, so self-modifying programs
+    still behave.
+
+    With `superinstructions`, two common pairs of instructions are decoded into
+    one: a comparison followed by a conditional jump on its result, and an
+    addition or multiplication followed by an unconditional jump. Only jumps
+    with an immediate target are fused, and their targets are kept in `jumps`.
+
+    VMs running the same program share the instructions decoded from its
+    unmodified words in a `SharedDecode`, so running many of them, or forks of
+    them, decodes it only once.
+    """
+    shared: SharedDecode
+    code: List[Optional[Instruction]]
+    owners: List[Optional[List[int]]]
+    jumps: Dict[int, int]
+    superinstructions = True
+
+    def __init__(self, prog: Program, inputs: Iterable[int] = ()):
+        super().__init__(prog, inputs)
+        self.shared = SHARED_DECODE.get((self.superinstructions, tuple(prog)))
+        self.code = self.shared.code[:]
+        self.owners = self.shared.owners[:]
+        self.jumps = dict(self.shared.jumps)
+
+    def extend(self, size: int) -> None:
+        super().extend(size)
+        missing = len(self.prog) - len(self.code)
+        self.code.extend([None] * missing)
+        self.owners.extend([None] * missing)
+
+    def written(self, addr: int) -> None:
+        if self.owners[addr] is not None:
+            self.invalidate(addr)
+
+    def copy_state(self, clone: Intcode) -> None:
+        super().copy_state(clone)
+        assert isinstance(clone, DecodedIntcode)
+        clone.code = self.code[:]
+        clone.owners = self.owners[:]
+        clone.jumps = dict(self.jumps)
+
+    def decode(self, pc: int) -> Instruction:
+        shared = self.shared
+        prog = self.prog
+        ins = shared.code[pc] if pc < len(shared.code) else None
+        if ins is not None and shared.unmodified(
+                prog, range(pc, pc + instruction_size(ins[0]))):
+            if ins[0] > 99:
+                self.jumps[pc] = shared.jumps[pc]
+        else:
+            ins = self.translate(pc)
+            words = range(pc, pc + instruction_size(ins[0]))
+            if shared.unmodified(prog, words):
+                shared.code[pc] = ins
+                add_owner(shared.owners, pc, words)
+                if ins[0] > 99:
+                    shared.jumps[pc] = self.jumps[pc]
+
+        self.code[pc] = ins
+        self.own(pc, instruction_size(ins[0]))
+        return ins
+
+    def translate(self, pc: int) -> Instruction:
+        """Decodes the instruction at `pc`, fusing it with a jump if it can."""
+        prog = self.prog
+        instr = prog[pc]
+        opc = instr % 100
+
+        if opc == 1 or opc == 2 or opc == 7 or opc == 8:
+            ins = (opc, instr // 100 % 10, prog[pc + 1],
+                   instr // 1000 % 10, prog[pc + 2],
+                   instr // 10000 % 10, prog[pc + 3])
+            fused = self.fuse(pc, ins) if self.superinstructions else None
+            if fused is not None:
+                ins = fused
+        elif opc == 5 or opc == 6:
+            ins = (opc, instr // 100 % 10, prog[pc + 1],
+                   instr // 1000 % 10, prog[pc + 2], 0, 0)
+        elif opc == 4 or opc == 9:
+            ins = (opc, instr // 100 % 10, prog[pc + 1], 0, 0, 0, 0)
+        elif opc == 3:
+            # The only parameter is written to, keep it in the c slot like the
+            # others.
+            ins = (opc, 0, 0, 0, 0, instr // 100 % 10, prog[pc + 1])
+        elif opc == 99:
+            ins = (opc, 0, 0, 0, 0, 0, 0)
+        else:
+            raise ValueError('unknown opcode {} at {}'.format(opc, pc))
+        return ins
+
+    def own(self, pc: int, size: int) -> None:
+        add_owner(self.owners, pc, range(pc, pc + size))
+
+    def preload(self, table: List[List[int]]) -> None:
+        """Fills the cache with instructions decoded by `load_decoded`.
+
+        Each row is a pc, the 7 fields of the instruction there and, for
+        superinstructions, the target of their jump.
+        """
+        for pc, opc, ma, a, mb, b, mc, c, target in table:
+            if opc > 99:
+                self.jumps[pc] = target
+            self.code[pc] = (opc, ma, a, mb, b, mc, c)
+            self.own(pc, instruction_size(opc))
+
+    def fuse(self, pc: int, ins: Instruction) -> Optional[Instruction]:
+        """Returns `ins` fused with the jump after it, if there is one."""
+        prog = self.prog
+        nxt = pc + 4
+        if nxt + 3 > len(prog):
+            return None
+        instr = prog[nxt]
+        if instr % 100 not in (5, 6) or instr // 1000 % 10 != 1:
+            return None
+        opc, ma, a, mb, b, mc, c = ins
+        if mc == 0 and nxt <= c < nxt + 3:
+            # The first instruction writes over the jump.
+            return None
+
+        mode = instr // 100 % 10
+        cond = prog[nxt + 1]
+        if mode == 1:
+            if (opc == 1 or opc == 2) and bool(cond) == (instr % 100 == 5):
+                kind = JUMP
+            else:
+                return None
+        elif (opc == 7 or opc == 8) and mode == mc and cond == c:
+            kind = JUMP_IF_TRUE if instr % 100 == 5 else JUMP_IF_FALSE
+        else:
+            return None
+        self.jumps[pc] = prog[nxt + 2]
+        return (kind + opc, ma, a, mb, b, mc, c)
+
+    def invalidate(self, addr: int) -> None:
+        code = self.code
+        for pc in self.owners[addr] or []:
+            code[pc] = None
+        self.owners[addr] = None
+
+    def execute(self, max_outputs: Optional[int] = None,
+                yield_on_input: bool = False,
+                budget: Optional[int] = None) -> List[Optional[int]]:
+        prog = self.prog
+        code = self.code
+        owners = self.owners
+        jumps = self.jumps
+        pc = self.pc
+        rel_base = self.rel_base
+        executed = self.instructions
+        outputs: List[Optional[int]] = []
+        limit = sys.maxsize if budget is None else executed + budget
+
+        while True:
+            executed += 1
+            try:
+                ins = code[pc]
+                if ins is None:
+                    ins = self.decode(pc)
+                opc, ma, a, mb, b, mc, c = ins
+
+                if opc == 3 or opc == 99:
+                    state = interpret(self, pc, rel_base, executed, outputs,
+                                      max_outputs, yield_on_input)
+                    if state is None:
+                        return outputs
+                    pc, rel_base, executed = state
+                    continue
+
+                if mc == 2:
+                    c += rel_base
+
+                if ma == 0:
+                    a = prog[a]
+                elif ma == 2:
+                    a = prog[rel_base + a]
+
+                if opc == 4:
+                    pc += 2
+                    self.output = a
+                    outputs.append(a)
+                    if len(outputs) == max_outputs:
+                        return suspend(self, pc, rel_base, executed, outputs)
+                    continue
+
+                if opc == 9:
+                    rel_base += a
+                    pc += 2
+                    continue
+
+                if mb == 0:
+                    b = prog[b]
+                elif mb == 2:
+                    b = prog[rel_base + b]
+
+                if opc == 5:
+                    pc = b if a else pc + 3
+                    if executed >= limit:
+                        break
+                    continue
+                if opc == 6:
+                    pc = b if not a else pc + 3
+                    if executed >= limit:
+                        break
+                    continue
+
+                if opc > 99:
+                    # Superinstructions, most common first.
+                    if opc == 208:
+                        value = 1 if a == b else 0
+                        taken = not value
+                    elif opc == 301:
+                        value = a + b
+                        taken = True
+                    elif opc == 108:
+                        taken = a == b
+                        value = 1 if taken else 0
+                    elif opc == 207:
+                        value = 1 if a < b else 0
+                        taken = not value
+                    elif opc == 107:
+                        taken = a < b
+                        value = 1 if taken else 0
+                    else:
+                        value = a * b
+                        taken = True
+                    prog[c] = value
+                    if owners[c] is not None:
+                        self.invalidate(c)
+                        if code[pc] is None:
+                            # Overwrote the jump, which has to be decoded on
+                            # its own again.
+                            pc += 4
+                            continue
+                    executed += 1
+                    pc = jumps[pc] if taken else pc + 7
+                    if executed >= limit:
+                        break
+                    continue
+
+                if opc == 1:
+                    prog[c] = a + b
+                elif opc == 2:
+                    prog[c] = a * b
+                elif opc == 7:
+                    prog[c] = 1 if a < b else 0
+                else:
+                    prog[c] = 1 if a == b else 0
+                if owners[c] is not None:
+                    self.invalidate(c)
+                pc += 4
+            except IndexError:
+                state = interpret(self, pc, rel_base, executed, outputs,
+                                  max_outputs, yield_on_input, fault=True)
+                if state is None:
+                    return outputs
+                pc, rel_base, executed = state
+
+        # Out of budget, which is only checked at jumps.
+        return suspend(self, pc, rel_base, executed, outputs)
+
+
+def load_decoded(s: str, inputs: Iterable[int] = ()) -> DecodedIntcode:
+    """Returns a `DecodedIntcode` for the program in `s`, its code decoded.
+
+    The code found by `analysis.Analysis` is decoded up front, and kept in the
+    cache next to the program so that later runs only have to read it back.
+    """
+    key = cache.cache_key(s)
+    vm = DecodedIntcode(str_to_prog(s), inputs)
+    # Tables with and without superinstructions are different entries.
+    kind = 'code-fused' if vm.superinstructions else 'code'
+    table = cache.load_words(key, kind, 9)
+    if table is None:
+        decoder = DecodedIntcode(vm.prog[:])
+        table = []
+        for pc in sorted(Analysis(decoder.prog).instructions):
+            ins = decoder.decode(pc)
+            table.append([pc, *ins, decoder.jumps.get(pc, 0)])
+        cache.save_words(key, kind, (word for row in table for word in row))
+    vm.preload(table)
+    return vm
+
+
+def test_fork_keeps_decoded_code() -> None:
+    prog = str_to_prog('104,0,1001,1,1,1,1001,17,-1,17,1005,17,0,99,0,0,0,3')
+    intc = DecodedIntcode(prog)
+    assert intc.feed([], 2) == [0, 1]
+    clone = intc.fork()
+    assert isinstance(clone, DecodedIntcode) and clone.code[10] is not None
+    assert clone.run() == [2]
+    assert intc.run() == [2]
+
+
+def test_shared_decode() -> None:
+    # Rewrites the operand of its output instruction, so only the first VM sees
+    # it unmodified.
+    prog = str_to_prog('104,0,1001,1,1,1,1001,17,-1,17,1005,17,0,99,0,0,0,3')
+    first = DecodedIntcode(prog)
+    assert first.run() == [0, 1, 2]
+    assert first.shared.code[0] == (4, 1, 0, 0, 0, 0, 0)
+    assert first.code[0] is None
+
+    second = DecodedIntcode(prog)
+    assert second.shared is first.shared
+    assert second.code[0] == (4, 1, 0, 0, 0, 0, 0)
+    assert second.run() == [0, 1, 2]
+    assert DecodedIntcode(prog).fork().run() == [0, 1, 2]
+
+
+# Outputs 0 to 2 in a loop, then 10 and 7, going through each kind of
+# superinstruction.
+SUPERINSTRUCTIONS = (
+    '1101,0,0,100,4,100,1001,100,1,100,1007,100,3,101,1005,101,4,'
+    '1101,5,5,102,1105,1,26,99,0,4,102,1008,102,10,103,1006,103,37,104,7,99')
+
+
+def test_superinstructions() -> None:
+    prog = str_to_prog(SUPERINSTRUCTIONS)
+    intc, ref = DecodedIntcode(prog), Intcode(prog)
+    assert intc.run() == ref.run() == [0, 1, 2, 10, 7]
+    assert intc.instructions == ref.instructions
+    opcodes = [intc.code[pc][0] for pc in [10, 17, 28]]  # type: ignore
+    assert opcodes == [107, 301, 208]
+
+
+def test_superinstruction_overwrites_jump() -> None:
+    # The addition writes the target of the jump after it, relative to the
+    # relative base.
+    prog = str_to_prog('109,10,21101,0,9,-2,1105,1,11,104,1,104,2,99')
+    intc = DecodedIntcode(prog)
+    assert intc.run() == Intcode(prog).run() == [1, 2]
+
+
+def test_load_decoded(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(cache, 'CACHE_DIR', str(tmp_path))
+    prog_str = SUPERINSTRUCTIONS
+    for _ in range(2):
+        intc = load_decoded(prog_str)
+        assert intc.code[10] == (107, 0, 100, 1, 3, 0, 101)
+        assert intc.jumps[10] == 4
+        assert intc.run() == Intcode(str_to_prog(prog_str)).run()
+    assert len(list(tmp_path.iterdir())) == 1
+
+    # A table cut off mid-row is decoded again.
+    entry, = tmp_path.iterdir()
+    entry.write_bytes(entry.read_bytes()[:-8])
+    assert load_decoded(prog_str).code[10] == (107, 0, 100, 1, 3, 0, 101)
+    assert len(entry.read_bytes()) % (8 * 9) == 0
+
+    # Without superinstructions, the table is decoded and kept again.
+    monkeypatch.setattr(DecodedIntcode, 'superinstructions', False)
+    intc = load_decoded(prog_str)
+    assert intc.code[10] == (7, 0, 100, 1, 3, 0, 101) and not intc.jumps
+    assert len(list(tmp_path.iterdir())) == 2
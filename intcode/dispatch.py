@@ -0,0 +1,144 @@
+from typing import (
+    TYPE_CHECKING, Callable, Dict, Generic, Hashable, Iterable, List,
+    Optional, Tuple, TypeVar,
+)
+
+if TYPE_CHECKING:
+    from .vm import Intcode
+
+# For every word of memory, the start of every piece of cached code made from
+# it.
+Owners = List[Optional[List[int]]]
+
+# Where a dispatch loop continues: the pc, the relative base and the
+# instruction count.
+State = Tuple[int, int, int]
+
+
+def suspend(vm: 'Intcode', pc: int, rel_base: int, executed: int,
+            outputs: List[Optional[int]]) -> List[Optional[int]]:
+    """Saves the state a dispatch loop keeps in locals to the VM.
+
+    Returns `outputs`, for the loop to return.
+    """
+    vm.pc = pc
+    vm.rel_base = rel_base
+    vm.instructions = executed
+    return outputs
+
+
+def interpret(vm: 'Intcode', pc: int, rel_base: int, executed: int,
+              outputs: List[Optional[int]], max_outputs: Optional[int],
+              yield_on_input: bool, fault: bool = False) -> Optional[State]:
+    """Executes the instruction at `pc` for a dispatch loop, the slow way.
+
+    Dispatch loops leave halts, inputs and anything else they don't handle
+    themselves to this, and with `fault` the instructions that went past the
+    end of dense memory, which are handled by `Intcode.fault`. Like in the
+    loops, `executed` already counts the instruction. Returns the state to
+    continue with, or None when the loop should return `outputs`, with the
+    state saved to the VM.
+    """
+    vm.instructions = executed - 1
+    if fault:
+        pc, rel_base, output = vm.fault(pc, rel_base)
+    else:
+        instr = vm.load(pc)
+        opc = instr % 100
+        if opc == 99:
+            vm.halted = True
+            suspend(vm, pc, rel_base, executed, outputs)
+            return None
+        if opc == 3:
+            addr = vm.load(pc + 1)
+            if instr // 100 % 10 == 2:
+                addr += rel_base
+            try:
+                value = next(vm.inputs)
+            except StopIteration:
+                suspend(vm, pc, rel_base, executed - 1, outputs)
+                return None
+            vm.instructions = executed
+            vm.store(addr, value)
+            if yield_on_input:
+                outputs.append(None)
+                if len(outputs) == max_outputs:
+                    suspend(vm, pc + 2, rel_base, executed, outputs)
+                    return None
+            return pc + 2, rel_base, executed
+        pc, rel_base, output = vm.step(pc, rel_base)
+
+    executed = vm.instructions
+    if output is not None:
+        outputs.append(output)
+        if len(outputs) == max_outputs:
+            suspend(vm, pc, rel_base, executed, outputs)
+            return None
+    return pc, rel_base, executed
+
+
+def add_owner(owners: Owners, start: int, addrs: Iterable[int]) -> None:
+    """Records that the code cached at `start` was made from `addrs`."""
+    # Lists are replaced rather than appended to, since forks and other VMs
+    # share them.
+    for addr in addrs:
+        owned = owners[addr]
+        if owned is None:
+            owners[addr] = [start]
+        elif start not in owned:
+            owners[addr] = owned + [start]
+
+
+class SharedImage:
+    """Code cached from the unmodified words of a program, for all its VMs.
+
+    Nothing ever writes to the image, so entries stay valid for as long as the
+    words of a VM they were made from are the same as the image's. Backends
+    subclass this with the code they cache.
+    """
+    image: Tuple[int, ...]
+    owners: Owners
+
+    def __init__(self, image: Tuple[int, ...]):
+        self.image = image
+        self.owners = [None] * len(image)
+
+    def unmodified(self, prog: List[int], addrs: Iterable[int]) -> bool:
+        """Whether the words of `prog` at `addrs` are still the image's."""
+        image = self.image
+        if isinstance(addrs, range):
+            # Contiguous words are compared as one slice, which is a lot
+            # faster.
+            start, stop = addrs.start, addrs.stop
+            return (stop <= len(image) and
+                    tuple(prog[start:stop]) == image[start:stop])
+        return all(addr < len(image) and prog[addr] == image[addr]
+                   for addr in addrs)
+
+
+K = TypeVar('K', bound=Hashable)
+S = TypeVar('S', bound=SharedImage)
+
+
+class SharedCache(Generic[K, S]):
+    """The `SharedImage` of every program run.
+
+    Each is made by `make`, from a key that holds the image. Once `size`
+    programs are cached, the cache is cleared before adding another.
+    """
+    make: Callable[[K], S]
+    size: int
+    entries: Dict[K, S]
+
+    def __init__(self, make: Callable[[K], S], size: int = 64):
+        self.make = make
+        self.size = size
+        self.entries = {}
+
+    def get(self, key: K) -> S:
+        shared = self.entries.get(key)
+        if shared is None:
+            if len(self.entries) >= self.size:
+                self.entries.clear()
+            shared = self.entries[key] = self.make(key)
+        return shared
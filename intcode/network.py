@@ -0,0 +1,208 @@
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import Connection
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Type
+
+import pytest
+
+from .vm import Intcode, Program, str_to_prog
+from .scheduler import Scheduler
+
+# Destination address, x and y.
+Packet = Tuple[int, int, int]
+
+
+class Network:
+    """Network of NICs, VMs that exchange packets by address like in day 23.
+
+    Every NIC first reads its own address. Packets are three outputs: the
+    destination address, x and y, which are then read by the destination as two
+    inputs. NICs read -1 when they have no packets, and are blocked when they
+    ask again after that. The network is idle once every NIC is blocked.
+
+    A NIC may stop between the outputs of a packet, to read input or at the end
+    of its timeslice, so its outputs are buffered in `partial` until the packet
+    is complete.
+    """
+    addrs: List[int]
+    index: Dict[int, int]
+    scheduler: Scheduler
+    partial: List[List[int]]
+
+    def __init__(self, prog: Program, addrs: Iterable[int],
+                 backend: Type[Intcode] = Intcode):
+        self.addrs = list(addrs)
+        self.index = {addr: i for i, addr in enumerate(self.addrs)}
+        self.scheduler = Scheduler([backend(prog) for _ in self.addrs],
+                                   empty=-1, timeslice=3)
+        self.partial = [[] for _ in self.addrs]
+        for i, addr in enumerate(self.addrs):
+            self.scheduler.send(i, [addr])
+
+    def __enter__(self) -> 'Network':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        pass
+
+    def run(self, packets: Iterable[Packet] = ()) -> List[Packet]:
+        """Delivers `packets` and runs until the network is idle.
+
+        Returns the packets sent to addresses outside of the network, in the
+        order they were sent.
+        """
+        scheduler = self.scheduler
+        index = self.index
+        for dest, x, y in packets:
+            scheduler.send(index[dest], [x, y])
+
+        outgoing = []
+        for i, outputs in scheduler.run():
+            partial = self.partial[i]
+            partial += outputs
+            while len(partial) >= 3:
+                dest, x, y = partial[:3]
+                del partial[:3]
+                if dest in index:
+                    scheduler.send(index[dest], [x, y])
+                else:
+                    outgoing.append((dest, x, y))
+        return outgoing
+
+    def instructions(self) -> Dict[int, int]:
+        """Number of instructions every NIC has executed, by address."""
+        nodes = self.scheduler.nodes
+        return {addr: node.vm.instructions
+                for addr, node in zip(self.addrs, nodes)}
+
+
+def run_shard(prog: Program, addrs: Sequence[int], backend: Type[Intcode],
+              conn: Connection) -> None:
+    network = Network(prog, addrs, backend)
+    while True:
+        command, packets = conn.recv()
+        if command == 'run':
+            conn.send(network.run(packets))
+        elif command == 'instructions':
+            conn.send(network.instructions())
+        else:
+            conn.close()
+            return
+
+
+class ShardedNetwork:
+    """A `Network` of addresses 0 to size - 1, split up over worker processes.
+
+    Every worker runs the NICs of its shard until they are idle, and sends back
+    the packets for other shards, which are delivered in the next round. The
+    network is idle after a round without any packets between shards.
+    """
+    size: int
+    conns: List[Connection]
+    procs: List[Process]
+
+    def __init__(self, prog: Program, size: int, shards: int,
+                 backend: Type[Intcode] = Intcode):
+        self.size = size
+        self.conns = []
+        self.procs = []
+        for shard in range(shards):
+            conn, child_conn = Pipe()
+            proc = Process(target=run_shard,
+                           args=(prog, range(shard, size, shards), backend,
+                                 child_conn),
+                           daemon=True)
+            proc.start()
+            self.conns.append(conn)
+            self.procs.append(proc)
+
+    def __enter__(self) -> 'ShardedNetwork':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        for conn in self.conns:
+            conn.send(('close', None))
+        for proc in self.procs:
+            proc.join()
+        self.conns = []
+        self.procs = []
+
+    def shard(self, addr: int) -> Optional[int]:
+        if not 0 <= addr < self.size:
+            return None
+        return addr % len(self.conns)
+
+    def run(self, packets: Iterable[Packet] = ()) -> List[Packet]:
+        """Delivers `packets` and runs until the network is idle.
+
+        Returns the packets sent to addresses outside of the network, in the
+        order of the rounds and shards they were sent in.
+        """
+        pending = list(packets)
+        outgoing = []
+        while True:
+            batches: List[List[Packet]] = [[] for _ in self.conns]
+            for packet in pending:
+                shard = self.shard(packet[0])
+                assert shard is not None
+                batches[shard].append(packet)
+            for conn, batch in zip(self.conns, batches):
+                conn.send(('run', batch))
+
+            pending = []
+            for conn in self.conns:
+                for packet in conn.recv():
+                    if self.shard(packet[0]) is None:
+                        outgoing.append(packet)
+                    else:
+                        pending.append(packet)
+            if not pending:
+                return outgoing
+
+    def instructions(self) -> Dict[int, int]:
+        """Number of instructions every NIC has executed, by address."""
+        counts = {}
+        for conn in self.conns:
+            conn.send(('instructions', None))
+        for conn in self.conns:
+            counts.update(conn.recv())
+        return dict(sorted(counts.items()))
+
+
+# Forwards every packet (x, y) it gets to the next address as (x, y - 1), or to
+# 255 once y is 0.
+FORWARDER = (
+    '3,100,3,101,1008,101,-1,102,1005,102,2,3,103,1006,103,44,1001,100,'
+    '1,104,1008,104,{},105,1006,105,31,1101,0,0,104,4,104,4,101,1001,'
+    '103,-1,103,4,103,1105,1,2,104,255,4,101,4,103,1105,1,2'
+)
+
+
+def test_partial_packets() -> None:
+    # Outputs the destination of a packet, and reads before the rest of it. The
+    # timeslices end in the middle of the next packet.
+    prog = str_to_prog('3,100,104,255,3,101,4,100,'
+                       '104,9,104,255,4,101,4,100,99')
+    with Network(prog, range(2)) as network:
+        assert network.run() == [(255, 0, 9), (255, 1, 9),
+                                 (255, -1, 0), (255, -1, 1)]
+
+
+@pytest.mark.parametrize('shards', [2, 3])
+def test_sharded_network(shards: int) -> None:
+    prog = str_to_prog(FORWARDER.format(7))
+    packets = [[(0, 1, 10)], [(5, 2, 3), (6, 3, 20)]]
+    with Network(prog, range(7)) as network:
+        expected = [network.run(sent) for sent in packets]
+        addrs = list(network.instructions())
+    assert expected == [[(255, 1, 0)], [(255, 2, 0), (255, 3, 0)]]
+
+    with ShardedNetwork(prog, 7, shards) as sharded:
+        assert [sharded.run(sent) for sent in packets] == expected
+        instructions = sharded.instructions()
+        assert list(instructions) == addrs and all(instructions.values())
@@ -0,0 +1,214 @@
+import sys
+import time
+from collections import Counter
+from typing import Counter as CounterType, Iterable, List, Optional
+
+from .vm import Intcode, Program, ARITY, OPCODE_NAMES, str_to_prog
+
+
+class Profile:
+    """What a `ProfiledIntcode` spent its time on.
+
+    `stacks` counts instructions by the call stack they were executed in, which
+    Intcode doesn't have, so it's reconstructed: increasing the relative base
+    after a jump enters a function starting at the jump target, and decreasing
+    it again returns from it.
+    """
+    opcodes: CounterType[int]
+    pcs: CounterType[int]
+    stacks: CounterType[str]
+    io_gaps: List[int]
+    interpreter_time: float
+    host_time: float
+
+    def __init__(self) -> None:
+        self.opcodes = Counter()
+        self.pcs = Counter()
+        self.stacks = Counter()
+        # Instructions executed between every two I/O instructions.
+        self.io_gaps = []
+        self.interpreter_time = 0.0
+        # Time spent getting inputs, and in the caller between outputs.
+        self.host_time = 0.0
+
+    def report(self, top: int = 10) -> str:
+        total = sum(self.opcodes.values())
+        lines = ['instructions: {}'.format(total)]
+        lines.append('interpreter time: {:.3f}s'.format(self.interpreter_time))
+        lines.append('host time: {:.3f}s'.format(self.host_time))
+
+        lines.append('')
+        lines.append('opcodes:')
+        for opc, count in self.opcodes.most_common():
+            lines.append('  {:<5} {:>10} {:6.1%}'.format(
+                OPCODE_NAMES[opc], count, count / total))
+
+        lines.append('')
+        lines.append('hottest pcs:')
+        for pc, count in self.pcs.most_common(top):
+            lines.append('  {:<5} {:>10} {:6.1%}'.format(
+                pc, count, count / total))
+
+        if self.io_gaps:
+            lines.append('')
+            gaps = self.io_gaps
+            lines.append(
+                'instructions between I/O: min {}, mean {:.1f}, max {}'.format(
+                    min(gaps), sum(gaps) / len(gaps), max(gaps)))
+        return '\n'.join(lines)
+
+    def folded(self) -> str:
+        """Instruction counts by stack, in flamegraph.pl's folded format."""
+        return ''.join('{} {}\n'.format(stack, count)
+                       for stack, count in sorted(self.stacks.items()))
+
+
+class ProfiledIntcode(Intcode):
+    """Intcode VM that records a `Profile` of everything it executes.
+
+    Instructions are executed one at a time through `step`, so it's a lot
+    slower than the other backends, which don't pay anything for profiling.
+    """
+    profile: Profile
+
+    def __init__(self, prog: Program, inputs: Iterable[int] = ()):
+        super().__init__(prog, inputs)
+        self.profile = Profile()
+        self.frames = ['main']
+        self.stack = 'main'
+        self.jump_target: Optional[int] = None
+        self.since_io = 0
+        # When `execute` last returned with outputs for the caller.
+        self.paused: Optional[float] = None
+
+    def copy_state(self, clone: Intcode) -> None:
+        """A fork starts a profile of its own, from the call stack it's in."""
+        super().copy_state(clone)
+        assert isinstance(clone, ProfiledIntcode)
+        clone.profile = Profile()
+        clone.frames = self.frames[:]
+        clone.paused = None
+
+    def enter_or_leave(self, enter: bool) -> None:
+        frames = self.frames
+        if enter:
+            # Without a jump, it's the current function making room for itself.
+            if self.jump_target is None:
+                frames.append(frames[-1])
+            else:
+                frames.append('fn@{}'.format(self.jump_target))
+                self.jump_target = None
+        elif len(frames) > 1:
+            frames.pop()
+        self.stack = ';'.join(frame for i, frame in enumerate(frames)
+                              if i == 0 or frame != frames[i - 1])
+
+    def execute(self, max_outputs: Optional[int] = None,
+                yield_on_input: bool = False,
+                budget: Optional[int] = None) -> List[Optional[int]]:
+        profile = self.profile
+        timer = time.perf_counter
+        mark = timer()
+        if self.paused is not None:
+            profile.host_time += mark - self.paused
+            self.paused = None
+        outputs: List[Optional[int]] = []
+        limit = sys.maxsize if budget is None else self.instructions + budget
+
+        while True:
+            pc = self.pc
+            instr = self.load(pc)
+            opc = instr % 100
+            if opc not in ARITY:
+                raise ValueError('unknown opcode {} at {}'.format(opc, pc))
+
+            if opc == 3:
+                addr = self.load(pc + 1)
+                if instr // 100 % 10 == 2:
+                    addr += self.rel_base
+                now = timer()
+                profile.interpreter_time += now - mark
+                try:
+                    value = next(self.inputs)
+                except StopIteration:
+                    profile.host_time += timer() - now
+                    return outputs
+                mark = timer()
+                profile.host_time += mark - now
+                self.store(addr, value)
+                self.pc = pc + 2
+                self.instructions += 1
+            elif opc == 99:
+                self.halted = True
+                self.instructions += 1
+            else:
+                rel_base = self.rel_base
+                self.pc, self.rel_base, output = self.step(pc, rel_base)
+                if opc == 5 or opc == 6:
+                    if self.pc != pc + 3:
+                        self.jump_target = self.pc
+                elif self.rel_base != rel_base:
+                    self.enter_or_leave(self.rel_base > rel_base)
+
+            profile.opcodes[opc] += 1
+            profile.pcs[pc] += 1
+            profile.stacks['{};{}'.format(self.stack, OPCODE_NAMES[opc])] += 1
+            self.since_io += 1
+            if opc == 3 or opc == 4:
+                profile.io_gaps.append(self.since_io - 1)
+                self.since_io = 0
+
+            if opc == 99:
+                profile.interpreter_time += timer() - mark
+                return outputs
+            if opc == 4 or (opc == 3 and yield_on_input):
+                outputs.append(output if opc == 4 else None)
+                if len(outputs) == max_outputs:
+                    self.paused = timer()
+                    profile.interpreter_time += self.paused - mark
+                    return outputs
+            # Like in the other backends, the budget is only checked at jumps.
+            if (opc == 5 or opc == 6) and self.instructions >= limit:
+                self.paused = timer()
+                profile.interpreter_time += self.paused - mark
+                return outputs
+
+
+def test_profile() -> None:
+    # Calls a function at 14 that outputs its argument three times, then halts.
+    prog = str_to_prog('109,100,21101,7,0,1,21101,13,0,0,1105,1,14,99,'
+                       '109,2,204,-1,204,-1,204,-1,109,-2,2106,0,0')
+    intc = ProfiledIntcode(prog)
+    assert intc.run() == [7, 7, 7]
+
+    profile = intc.profile
+    assert sum(profile.opcodes.values()) == intc.instructions
+    assert profile.opcodes == {9: 3, 1: 2, 5: 1, 4: 3, 6: 1, 99: 1}
+    assert (profile.pcs[16], profile.pcs[13], profile.pcs[15]) == (1, 1, 0)
+    assert profile.io_gaps == [5, 0, 0]
+    assert profile.folded().splitlines() == [
+        'main;add 2',
+        'main;arb 2',
+        'main;fn@14;arb 1',
+        'main;fn@14;out 3',
+        'main;halt 1',
+        'main;jnz 1',
+        'main;jz 1',
+    ]
+    assert '  out            3  27.3%' in profile.report().splitlines()
+
+
+def test_fork() -> None:
+    prog = str_to_prog('109,100,21101,7,0,1,21101,13,0,0,1105,1,14,99,'
+                       '109,2,204,-1,204,-1,204,-1,109,-2,2106,0,0')
+    intc = ProfiledIntcode(prog)
+    assert intc.take(1) == (7,)
+    clone = intc.fork()
+    snapshot = intc.snapshot()
+    assert intc.run() == clone.run() == snapshot.fork().run() == [7, 7]
+
+    assert isinstance(clone, ProfiledIntcode)
+    assert clone.profile is not intc.profile
+    assert clone.frames == intc.frames and clone.frames is not intc.frames
+    assert clone.profile.opcodes == {4: 2, 9: 1, 6: 1, 99: 1}
+    assert sum(intc.profile.opcodes.values()) == intc.instructions
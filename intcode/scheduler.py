@@ -0,0 +1,164 @@
+from collections import deque
+from typing import Callable, Deque, Iterable, Iterator, List, Optional, Tuple
+
+import pytest
+
+from .vm import Intcode, Status, str_to_prog, values
+
+
+class Node:
+    """A VM run by a `Scheduler`, and the inputs queued up for it."""
+    vm: Intcode
+    queue: Deque[int]
+    empty: Optional[int]
+    scheduled: bool
+
+    def __init__(self, vm: Intcode, empty: Optional[int]):
+        self.vm = vm
+        self.queue = deque()
+        self.empty = empty
+        self.scheduled = False
+
+    def take(self) -> Optional[int]:
+        return self.queue.popleft() if self.queue else None
+
+
+def available(take: Callable[[], Optional[int]],
+              empty: Optional[int]) -> Iterator[int]:
+    """Inputs that can be read without waiting, including the `empty` value.
+
+    `take` returns the next queued input, or None when there is none. Then
+    `empty` is read instead, unless it was just read already, which ends the
+    inputs.
+    """
+    gave_empty = False
+    while True:
+        value = take()
+        if value is not None:
+            gave_empty = False
+            yield value
+        elif gave_empty or empty is None:
+            return
+        else:
+            gave_empty = True
+            yield empty
+
+
+class Scheduler:
+    """Runs a network of VMs, only running the ones that have something to do.
+
+    A VM is blocked when it asks for input and none is queued up for it, and
+    isn't run again until `send` gives it some. Programs that poll for input
+    can be given an `empty` value, which is read once whenever the queue is
+    empty. Asking again after that blocks the VM.
+
+    VMs that keep running without blocking are stopped after `timeslice`
+    outputs, or after about `budget` instructions if given, and continue after
+    the other VMs that have work have had their turn. Without a budget, a VM
+    that loops without output or input never gives the others a turn.
+    """
+    nodes: List[Node]
+    ready: Deque[int]
+    timeslice: int
+    budget: Optional[int]
+
+    def __init__(self, vms: Iterable[Intcode], empty: Optional[int] = None,
+                 timeslice: int = 1, budget: Optional[int] = None):
+        self.nodes = [Node(vm, empty) for vm in vms]
+        self.ready = deque()
+        self.timeslice = timeslice
+        self.budget = budget
+        for i in range(len(self.nodes)):
+            self.schedule(i)
+
+    def schedule(self, i: int) -> None:
+        node = self.nodes[i]
+        if not node.scheduled and not node.vm.halted:
+            node.scheduled = True
+            self.ready.append(i)
+
+    def send(self, i: int, values: Iterable[int]) -> None:
+        self.nodes[i].queue.extend(values)
+        self.schedule(i)
+
+    @property
+    def idle(self) -> bool:
+        """Whether every VM is blocked or halted."""
+        return not self.ready
+
+    def run(self) -> Iterator[Tuple[int, List[int]]]:
+        """Runs VMs until all of them are blocked or halted.
+
+        Yields the index of a VM and its outputs, at the end of every timeslice
+        that had any.
+        """
+        timeslice = self.timeslice
+        while self.ready:
+            i = self.ready.popleft()
+            node = self.nodes[i]
+            node.scheduled = False
+            vm = node.vm
+            vm.inputs = available(node.take, node.empty)
+
+            status, outputs = vm.run_for(self.budget, max_outputs=timeslice)
+            if (status is Status.OUTPUT_READY or
+                    status is Status.BUDGET_EXHAUSTED):
+                # Only blocking takes a VM out of the rotation.
+                self.schedule(i)
+
+            if outputs:
+                yield i, values(outputs)
+
+
+# Doubles every input it reads, until it reads a 0. Reads -1 when there's no
+# input.
+DOUBLER = ('3,100,1008,100,-1,101,1005,101,0,1006,100,21,'
+           '1002,100,2,100,4,100,1105,1,0,99')
+
+
+def test_scheduler() -> None:
+    prog = str_to_prog(DOUBLER)
+    network = Scheduler([Intcode(prog) for _ in range(3)], empty=-1)
+    network.send(0, [1])
+
+    # Every output is sent on to the next VM, and the last VM's back to the
+    # first.
+    outputs = []
+    for i, (value,) in network.run():
+        outputs.append((i, value))
+        if value < 100:
+            network.send((i + 1) % 3, [value])
+    assert network.idle
+    assert outputs == [(0, 2), (1, 4), (2, 8), (0, 16), (1, 32), (2, 64),
+                       (0, 128)]
+
+    # Blocked VMs aren't run, only the one that was sent something.
+    counts = [node.vm.instructions for node in network.nodes]
+    network.send(1, [0])
+    assert list(network.run()) == []
+    assert network.nodes[1].vm.halted
+    assert [node.vm.instructions for node in network.nodes] == \
+        [counts[0], counts[1] + 5, counts[2]]
+
+
+@pytest.mark.parametrize('timeslice', [1, 2, 3])
+def test_timeslice(timeslice: int) -> None:
+    # Counts down from 5 without ever reading input again.
+    prog = str_to_prog('1101,5,0,100,4,100,1001,100,-1,100,1005,100,4,99')
+    network = Scheduler([Intcode(prog), Intcode(prog)], timeslice=timeslice)
+    runs = list(network.run())
+    assert [i for i, _ in runs[:4]] == [0, 1, 0, 1]
+    assert sum(len(outputs) for _, outputs in runs) == 10
+    assert all(len(outputs) <= timeslice for _, outputs in runs)
+
+
+def test_budget() -> None:
+    # The first VM spins forever without output, the second outputs 1 and
+    # halts.
+    vms = [Intcode(str_to_prog('1105,1,0')), Intcode(str_to_prog('104,1,99'))]
+    network = Scheduler(vms, timeslice=2, budget=100)
+    runs = network.run()
+    assert next(runs) == (1, [1])
+    assert network.nodes[1].vm.halted
+    assert network.ready == deque([0])
+    assert network.nodes[0].vm.instructions == 100
@@ -0,0 +1,375 @@
+import sys
+import struct
+import zlib
+from itertools import zip_longest
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple, Type
+
+import pytest
+
+from .vm import Intcode, Program, Status, ARITY, str_to_prog
+from .decoded import DecodedIntcode
+from .compiled import CompiledIntcode
+
+# Kinds of events. Inputs and outputs are always recorded, writes to memory and
+# jumps only when tracing every step.
+INPUT, OUTPUT, WRITE, JUMP = range(4)
+
+# Kind, the number of instructions executed including the one that caused the
+# event, the address written to or jumped from, and the value read, output,
+# written or jumped to.
+Event = Tuple[int, int, int, int]
+
+MAGIC = b'ICTRACE1'
+# Whether every step was traced, and the CRC-32 of the program.
+HEADER = struct.Struct('<BI')
+RECORDS = {
+    INPUT: struct.Struct('<qq'),
+    OUTPUT: struct.Struct('<qq'),
+    WRITE: struct.Struct('<qqq'),
+    JUMP: struct.Struct('<qqq'),
+}
+
+
+def checksum(prog: Program) -> int:
+    return zlib.crc32(','.join(map(str, prog)).encode())
+
+
+class TraceWriter:
+    """Writes events to a trace file as they happen.
+
+    Records are a byte for the kind followed by 64-bit integers, so values have
+    to fit in those. Writes go through a buffer of `buffer_size` bytes, which
+    is all the memory a trace takes no matter how long the program runs.
+    """
+    file: BinaryIO
+    steps: bool
+
+    def __init__(self, path: str, prog: Program, steps: bool = False,
+                 buffer_size: int = 1 << 16):
+        self.file = open(path, 'wb', buffering=buffer_size)
+        self.steps = steps
+        self.file.write(MAGIC)
+        self.file.write(HEADER.pack(steps, checksum(prog)))
+
+    def __enter__(self) -> 'TraceWriter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.file.close()
+
+    def write(self, kind: int, instruction: int, addr: int,
+              value: int) -> None:
+        self.file.write(bytes((kind,)))
+        if kind == INPUT or kind == OUTPUT:
+            self.file.write(RECORDS[kind].pack(instruction, value))
+        else:
+            self.file.write(RECORDS[kind].pack(instruction, addr, value))
+
+
+def read_header(f: BinaryIO) -> Tuple[bool, int]:
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError('not an Intcode trace')
+    steps, crc = HEADER.unpack(f.read(HEADER.size))
+    return bool(steps), crc
+
+
+def read_trace(path: str, kinds: Iterable[int] = RECORDS) -> Iterator[Event]:
+    """Streams the events of kind `kinds` from a trace file, in order."""
+    kinds = set(kinds)
+    with open(path, 'rb') as f:
+        read_header(f)
+        while True:
+            kind = f.read(1)
+            if not kind:
+                return
+            record = RECORDS[kind[0]]
+            fields = record.unpack(f.read(record.size))
+            if kind[0] in kinds:
+                if len(fields) == 2:
+                    yield kind[0], fields[0], 0, fields[1]
+                else:
+                    yield (kind[0],) + fields
+
+
+class TracedIntcode(Intcode):
+    """Intcode VM that records its inputs and outputs to a `TraceWriter`.
+
+    When the writer traces every step, instructions are executed one at a time
+    through `step`, and every write to memory and every jump taken is recorded
+    as well.
+    """
+    trace: TraceWriter
+    last_input: int
+
+    def __init__(self, prog: Program, trace: TraceWriter,
+                 inputs: Iterable[int] = ()):
+        super().__init__(prog, inputs)
+        self.trace = trace
+        self.last_input = 0
+
+    def fork(self, inputs: Optional[Iterable[int]] = None) -> Intcode:
+        """Traced VMs can't be forked.
+
+        A fork would either write into this VM's trace, or start a trace of its
+        own in the middle of the program, which can't be replayed.
+        """
+        raise ValueError('cannot fork a traced VM')
+
+    def tap(self, inputs: Iterator[int]) -> Iterator[int]:
+        for value in inputs:
+            self.last_input = value
+            yield value
+
+    def store(self, addr: int, value: int) -> None:
+        if self.trace.steps:
+            self.trace.write(WRITE, self.instructions, addr, value)
+        super().store(addr, value)
+
+    def execute(self, max_outputs: Optional[int] = None,
+                yield_on_input: bool = False,
+                budget: Optional[int] = None) -> List[Optional[int]]:
+        inputs = self.inputs
+        self.inputs = self.tap(inputs)
+        outputs: List[Optional[int]] = []
+        limit = sys.maxsize if budget is None else self.instructions + budget
+        try:
+            # One event at a time, so that each is recorded with its own
+            # instruction count. The budget is only checked at jumps, where
+            # running out stops without an event.
+            while len(outputs) != max_outputs:
+                if self.trace.steps:
+                    events = self.steps(limit)
+                else:
+                    events = super().execute(
+                        1, True, limit - self.instructions)
+                if not events:
+                    break
+                output = events[0]
+                if output is None:
+                    self.trace.write(
+                        INPUT, self.instructions, 0, self.last_input)
+                    if yield_on_input:
+                        outputs.append(None)
+                else:
+                    self.trace.write(OUTPUT, self.instructions, 0, output)
+                    outputs.append(output)
+        finally:
+            # The tap only ever takes one value at a time, so nothing is lost
+            # by dropping it.
+            self.inputs = inputs
+        return outputs
+
+    def steps(self, limit: int = sys.maxsize) -> List[Optional[int]]:
+        """Executes instructions one at a time, up to the next input or output.
+
+        The input or output is executed as well.
+
+        Stops early at a jump once `instructions` reaches `limit`.
+        """
+        while True:
+            pc = self.pc
+            instr = self.load(pc)
+            opc = instr % 100
+            if opc not in ARITY:
+                raise ValueError('unknown opcode {} at {}'.format(opc, pc))
+
+            if opc == 99:
+                self.halted = True
+                self.instructions += 1
+                return []
+            if opc == 3:
+                addr = self.load(pc + 1)
+                if instr // 100 % 10 == 2:
+                    addr += self.rel_base
+                try:
+                    value = next(self.inputs)
+                except StopIteration:
+                    return []
+                self.instructions += 1
+                self.store(addr, value)
+                self.pc = pc + 2
+                return [None]
+
+            self.pc, self.rel_base, output = self.step(pc, self.rel_base)
+            if self.pc != pc + ARITY[opc] + 1:
+                self.trace.write(JUMP, self.instructions, pc, self.pc)
+            if output is not None:
+                return [output]
+            if (opc == 5 or opc == 6) and self.instructions >= limit:
+                return []
+
+
+def step_until(vm: Intcode, instructions: int) -> None:
+    """Executes single instructions until `instructions` have been executed.
+
+    Stops early when the program halts or needs input.
+    """
+    while vm.instructions < instructions and not vm.halted:
+        opc = vm.load(vm.pc) % 100
+        if opc == 3:
+            return
+        if opc == 99:
+            vm.halted = True
+            vm.instructions += 1
+            return
+        vm.pc, vm.rel_base, _ = vm.step(vm.pc, vm.rel_base)
+
+
+def replay(prog: Program, path: str, until: Optional[int] = None,
+           backend: Type[Intcode] = Intcode) -> Intcode:
+    """Runs `prog` on the inputs recorded in a trace, without the host logic.
+
+    Every input and output is checked against the trace, and a ValueError is
+    raised as soon as the run goes differently. With `until`, the VM is
+    fast-forwarded to the point where that many instructions have been executed
+    and returned there, for inspecting or forking. Otherwise it's returned
+    where the trace ends.
+    """
+    with open(path, 'rb') as f:
+        _, crc = read_header(f)
+    if crc != checksum(prog):
+        raise ValueError('trace was recorded for a different program')
+
+    events = read_trace(path, (INPUT, OUTPUT))
+    inputs = (value for _, _, _, value in read_trace(path, (INPUT,)))
+    vm = backend(prog, inputs)
+    limit = float('inf') if until is None else until
+
+    event = next(events, None)
+    run = vm.iterable(yield_on_input=True)
+    while event is not None and event[1] <= limit:
+        try:
+            output = next(run)
+        except StopIteration:
+            # The VM halted or ran out of input.
+            break
+        if output is None:
+            actual = (INPUT, vm.instructions, 0, event[3])
+        else:
+            actual = (OUTPUT, vm.instructions, 0, output)
+        if actual != event:
+            raise ValueError('replay diverged from trace: {} instead of {}'
+                             .format(actual, event))
+        event = next(events, None)
+    run.close()
+
+    if event is not None and until is None:
+        raise ValueError('replay stopped before the end of the trace, at {}'
+                         .format(event))
+    if until is not None:
+        step_until(vm, until)
+    return vm
+
+
+def diff_traces(path_a: str, path_b: str
+                ) -> Optional[Tuple[int, Optional[Event], Optional[Event]]]:
+    """Finds the first event that differs between two traces.
+
+    Returns its index and the event in either trace, None for a trace that
+    ended before it, or None if the traces are the same.
+    """
+    pairs = zip_longest(read_trace(path_a), read_trace(path_b))
+    for i, (a, b) in enumerate(pairs):
+        if a != b:
+            return i, a, b
+    return None
+
+
+# Outputs the running sum of its inputs.
+SUMMER = '3,100,1,100,101,101,4,101,1105,1,0'
+
+
+@pytest.mark.parametrize('steps', [False, True])
+def test_record_and_replay(tmp_path, steps: bool) -> None:
+    prog = str_to_prog(SUMMER)
+    path = str(tmp_path / 'trace')
+    with TraceWriter(path, prog, steps) as trace:
+        intc = TracedIntcode(prog, trace, [1, 2, 3])
+        assert intc.run() == [1, 3, 6]
+        assert intc.feed([4]) == 10
+
+    io = list(read_trace(path, (INPUT, OUTPUT)))
+    assert io[:4] == [(INPUT, 1, 0, 1), (OUTPUT, 3, 0, 1),
+                      (INPUT, 5, 0, 2), (OUTPUT, 7, 0, 3)]
+    assert len(io) == 8
+    writes = list(read_trace(path, (WRITE, JUMP)))
+    if steps:
+        assert writes[:3] == [(WRITE, 1, 100, 1), (WRITE, 2, 101, 1),
+                              (JUMP, 4, 8, 0)]
+    else:
+        assert writes == []
+
+    for backend in [Intcode, DecodedIntcode, CompiledIntcode]:
+        replayed = replay(prog, path, backend=backend)
+        assert replayed.output == 10
+        assert replayed.instructions == intc.instructions
+
+    with pytest.raises(ValueError):
+        replay(str_to_prog(SUMMER.replace('1,100,101', '2,100,101')), path)
+    with TraceWriter(path, prog) as trace:
+        trace.write(INPUT, 1, 0, 1)
+        trace.write(OUTPUT, 3, 0, 2)
+    with pytest.raises(ValueError):
+        replay(prog, path)
+
+
+@pytest.mark.parametrize('backend', [Intcode, DecodedIntcode, CompiledIntcode])
+def test_fast_forward(tmp_path, backend: Type[Intcode]) -> None:
+    prog = str_to_prog(SUMMER)
+    path = str(tmp_path / 'trace')
+    with TraceWriter(path, prog) as trace:
+        TracedIntcode(prog, trace, [1, 2, 3]).run()
+
+    # State before every instruction, executing them one at a time.
+    states: List[Tuple[int, int]] = []
+    intc = Intcode(prog, [1, 2, 3])
+    for n in range(12):
+        states.append((intc.pc, intc.load(101)))
+        if intc.needs_input:
+            next(intc.iterable(yield_on_input=True))
+        else:
+            step_until(intc, n + 1)
+    states.append((intc.pc, intc.load(101)))
+
+    for n in range(14):
+        vm = replay(prog, path, n, backend)
+        assert vm.instructions == min(n, 12)
+        assert (vm.pc, vm.load(101)) == states[min(n, 12)]
+
+
+def test_fork(tmp_path) -> None:
+    prog = str_to_prog(SUMMER)
+    with TraceWriter(str(tmp_path / 'trace'), prog) as trace:
+        intc = TracedIntcode(prog, trace, [1])
+        with pytest.raises(ValueError):
+            intc.fork()
+        with pytest.raises(ValueError):
+            intc.snapshot()
+
+
+def test_diff_traces(tmp_path) -> None:
+    prog = str_to_prog(SUMMER)
+    paths = [str(tmp_path / name) for name in 'abc']
+    for path, inputs in zip(paths, [[1, 2, 3], [1, 5, 3], [1, 2]]):
+        with TraceWriter(path, prog) as trace:
+            TracedIntcode(prog, trace, inputs).run()
+
+    assert diff_traces(paths[0], paths[0]) is None
+    assert diff_traces(paths[0], paths[1]) == \
+        (2, (INPUT, 5, 0, 2), (INPUT, 5, 0, 5))
+    assert diff_traces(paths[0], paths[2]) == (4, (INPUT, 9, 0, 3), None)
+
+
+@pytest.mark.parametrize('steps', [False, True])
+def test_budget(tmp_path, steps: bool) -> None:
+    prog = str_to_prog(SUMMER)
+    path = str(tmp_path / 'trace')
+    with TraceWriter(path, prog, steps) as trace:
+        intc = TracedIntcode(prog, trace, [1, 2, 3])
+        status, outputs = intc.run_for(6)
+        assert status is Status.BUDGET_EXHAUSTED and outputs[0] == 1
+        assert intc.run() == [3, 6][len(outputs) - 1:]
+    assert replay(prog, path).output == 6
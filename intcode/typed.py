@@ -0,0 +1,97 @@
+from array import array
+from typing import Iterable, List, Optional
+
+import pytest
+
+from .vm import Intcode, Program, str_to_prog
+
+# Range of the signed 64-bit words in typed memory.
+MIN_WORD = -1 << 63
+MAX_WORD = (1 << 63) - 1
+
+
+class TypedIntcode(Intcode):
+    """Intcode VM with its dense memory in an array of 64-bit words.
+
+    That takes an eighth of the memory a list of ints does, but every load
+    makes a new int, so it runs slower than `Intcode` and is only worth it for
+    programs that use a lot of memory. Values rarely get larger than 64 bits,
+    but when one does, dense memory is converted to a list of Python ints and
+    execution continues as with `Intcode`. `promoted_at` is the number of
+    instructions executed by then, or None if the program never needed it.
+    """
+    prog: Program
+    promoted_at: Optional[int]
+
+    def __init__(self, prog: Program, inputs: Iterable[int] = ()):
+        super().__init__(prog, inputs)
+        self.promoted_at = None
+        try:
+            self.prog = array('q', self.prog)  # type: ignore
+        except OverflowError:
+            self.promoted_at = 0
+
+    @property
+    def promoted(self) -> bool:
+        return self.promoted_at is not None
+
+    @property
+    def memory_bytes(self) -> int:
+        """Size of dense memory in bytes, without the ints once promoted."""
+        prog = self.prog
+        if isinstance(prog, array):
+            return prog.itemsize * len(prog)
+        return 8 * len(prog)
+
+    def promote(self) -> None:
+        if self.promoted_at is None:
+            self.promoted_at = self.instructions
+            self.prog = list(self.prog)
+
+    def extend(self, size: int) -> None:
+        # Sparse values that are moved to dense memory have to fit as well.
+        if self.promoted_at is None and any(
+                not MIN_WORD <= value <= MAX_WORD
+                for addr, value in self.sparse.items() if addr < size):
+            self.promote()
+        super().extend(size)
+
+    def store(self, addr: int, value: int) -> None:
+        if self.promoted_at is None and not MIN_WORD <= value <= MAX_WORD:
+            self.promote()
+        super().store(addr, value)
+
+
+@pytest.mark.parametrize(
+    'prog_str, inputs, promoted', [
+        ('3,9,8,9,10,9,4,9,99,-1,8', [8], False),
+        ('1102,34915192,34915192,7,4,7,99,0', [], False),
+        # The product overflows, as does an input written to dense and to
+        # sparse memory.
+        ('1102,4294967296,4294967296,7,4,7,99,0', [], True),
+        ('3,5,4,5,99,0', [-1 << 64], True),
+        ('3,1000000000,109,999999990,22201,10,10,11,204,11,99', [1 << 63],
+         True),
+    ]
+)
+def test_promoted(prog_str: str, inputs: List[int], promoted: bool) -> None:
+    prog = str_to_prog(prog_str)
+    intc, ref = TypedIntcode(prog, inputs), Intcode(prog, inputs)
+    assert intc.run() == ref.run()
+    assert intc.promoted == promoted
+    assert isinstance(intc.prog, list) == promoted
+
+
+def test_promoted_at() -> None:
+    # Doubles 1 until it no longer fits in 64 bits, then outputs it.
+    prog = str_to_prog('1002,100,2,100,107,{},100,101,1006,101,0,4,100,99'
+                       .format(1 << 62))
+    intc = TypedIntcode(prog + [0] * 86 + [1])
+    assert intc.run() == [1 << 63]
+    assert intc.promoted_at == 3 * 62
+
+    intc = TypedIntcode(str_to_prog('104,{},99'.format(1 << 64)))
+    assert intc.promoted_at == 0 and intc.run() == [1 << 64]
+
+    intc = TypedIntcode(str_to_prog('1101,1,2,2000,4,2000,99'))
+    assert intc.run() == [3] and intc.memory_bytes == 8 * 2048
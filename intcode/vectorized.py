@@ -0,0 +1,366 @@
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pytest
+
+from .vm import (
+    Intcode, Program, ARITY, PAGE_SIZE, MAX_DENSE_GROWTH, str_to_prog,
+)
+
+
+class VectorIntcode:
+    """Many copies of one Intcode program, run in lock-step on NumPy arrays.
+
+    Every lane has its own row of `mem`, pc and relative base. Each step
+    executes one instruction for all the lanes that are at the same pc with the
+    same instruction there, starting with the lowest pc so that lanes that fell
+    behind catch up with the others where their paths join again.
+
+    Values are 64-bit integers. A lane whose addition or multiplication doesn't
+    fit in one is moved to a scalar `Intcode` in `scalar`, which continues it
+    from that instruction with Python ints. So is a lane fed an input that
+    doesn't fit, or using an address too far past the end of memory for every
+    lane to grow to it, and every lane of a program that doesn't fit to begin
+    with. `memory` finds the memory of a lane wherever it runs.
+
+    A lane stops when it halts or runs out of inputs. `feed` gives it more,
+    after which `run` continues it.
+    """
+    mem: np.ndarray
+    pc: np.ndarray
+    rel_base: np.ndarray
+    halted: np.ndarray
+    waiting: np.ndarray
+    outputs: List[List[int]]
+    scalar: Dict[int, Intcode]
+
+    def __init__(self, prog: Program, lanes: int,
+                 inputs: Optional[Sequence[Sequence[int]]] = None):
+        self.pc = np.zeros(lanes, dtype=np.int64)
+        self.rel_base = np.zeros(lanes, dtype=np.int64)
+        self.halted = np.zeros(lanes, dtype=bool)
+        self.waiting = np.zeros(lanes, dtype=bool)
+        self.outputs = [[] for _ in range(lanes)]
+        self.scalar = {}
+        if fits(prog):
+            self.mem = np.tile(np.array(prog, dtype=np.int64), (lanes, 1))
+        else:
+            self.mem = np.zeros((lanes, 0), dtype=np.int64)
+            self.scalar = {lane: Intcode(prog) for lane in range(lanes)}
+
+        self.input_buf = np.zeros((lanes, 0), dtype=np.int64)
+        self.input_len = np.zeros(lanes, dtype=np.int64)
+        self.input_pos = np.zeros(lanes, dtype=np.int64)
+        if inputs is not None:
+            self.feed(inputs)
+
+    @property
+    def lanes(self) -> int:
+        return len(self.pc)
+
+    def memory(self, lane: int) -> Sequence[int]:
+        """The dense memory of lane `lane`.
+
+        That's a row of `mem`, unless the lane runs scalar.
+        """
+        if lane in self.scalar:
+            return self.scalar[lane].prog
+        return self.mem[lane]
+
+    def feed(self, inputs: Sequence[Sequence[int]]) -> None:
+        """Appends `inputs[i]` to the inputs of lane i."""
+        assert len(inputs) == self.lanes
+        width = int(max((len(lane) for lane in inputs), default=0))
+        needed = int((self.input_len + width).max(initial=0))
+        if needed > self.input_buf.shape[1]:
+            grown = np.zeros((self.lanes, needed), dtype=np.int64)
+            grown[:, :self.input_buf.shape[1]] = self.input_buf
+            self.input_buf = grown
+
+        for lane, values in enumerate(inputs):
+            if not len(values):
+                continue
+            if lane not in self.scalar and not fits(values):
+                self.scalar[lane] = self.scalar_vm(lane)
+            if lane in self.scalar:
+                vm = self.scalar[lane]
+                vm.inputs = chain(vm.inputs, list(values))
+            else:
+                start = self.input_len[lane]
+                self.input_buf[lane, start:start + len(values)] = values
+                self.input_len[lane] += len(values)
+            self.waiting[lane] = False
+
+    def reserve(self, addrs: np.ndarray) -> np.ndarray:
+        """Grows memory so that the addresses in `addrs` are valid.
+
+        Returns which of them are too far past the end of memory to grow to,
+        and are left for scalar VMs.
+        """
+        width = self.mem.shape[1]
+        far = addrs - width >= MAX_DENSE_GROWTH
+        if not len(addrs):
+            return far
+        if addrs.min() < 0:
+            raise IndexError('negative address {}'.format(addrs.min()))
+        near = addrs[~far]
+        size = int(near.max()) + 1 if len(near) else 0
+        if size > width:
+            size = -(-size // PAGE_SIZE) * PAGE_SIZE
+            grown = np.zeros((self.lanes, size), dtype=np.int64)
+            grown[:, :width] = self.mem
+            self.mem = grown
+        return far
+
+    def run(self) -> List[List[int]]:
+        """Runs every lane until it halts or needs more input.
+
+        Returns the outputs of every lane so far.
+        """
+        for lane in self.scalar:
+            if not (self.halted[lane] or self.waiting[lane]):
+                self.resume(lane)
+
+        while True:
+            live = np.flatnonzero(~(self.halted | self.waiting))
+            if not len(live):
+                return self.outputs
+
+            pcs = self.pc[live]
+            pc = int(pcs.min())
+            lanes = live[pcs == pc]
+            if self.reserve(np.array([pc])).any():
+                self.detach(lanes)
+                continue
+            instrs = self.mem[lanes, pc]
+            instr = int(instrs[0])
+            if len(lanes) > 1:
+                # Lanes may have overwritten the instruction differently.
+                lanes = lanes[instrs == instr]
+            self.step(pc, instr, lanes)
+
+    def step(self, pc: int, instr: int, lanes: np.ndarray) -> None:
+        opc = instr % 100
+        if opc not in ARITY:
+            raise ValueError('unknown opcode {} at {}'.format(opc, pc))
+        if opc == 99:
+            self.halted[lanes] = True
+            return
+
+        if self.reserve(np.array([pc + ARITY[opc]])).any():
+            self.detach(lanes)
+            return
+        modes = [instr // 100 % 10, instr // 1000 % 10, instr // 10000 % 10]
+
+        # Addresses of the parameters that aren't immediate, for every lane.
+        addrs_of: List[Optional[np.ndarray]] = []
+        far = np.zeros(len(lanes), dtype=bool)
+        for i in range(ARITY[opc]):
+            if modes[i] == 1:
+                addrs_of.append(None)
+                continue
+            addrs = self.mem[lanes, pc + 1 + i]
+            if modes[i] == 2:
+                addrs = addrs + self.rel_base[lanes]
+            far |= self.reserve(addrs)
+            addrs_of.append(addrs)
+        if far.any():
+            self.detach(lanes[far])
+            lanes = lanes[~far]
+            addrs_of = [None if addrs is None else addrs[~far]
+                        for addrs in addrs_of]
+
+        def address(i: int) -> np.ndarray:
+            addrs = addrs_of[i]
+            assert addrs is not None
+            return addrs
+
+        def param(i: int) -> np.ndarray:
+            if modes[i] == 1:
+                return self.mem[lanes, pc + 1 + i]
+            return self.mem[lanes, address(i)]
+
+        if opc == 3:
+            addrs = address(0)
+            has_input = self.input_pos[lanes] < self.input_len[lanes]
+            self.waiting[lanes[~has_input]] = True
+            lanes, addrs = lanes[has_input], addrs[has_input]
+            values = self.input_buf[lanes, self.input_pos[lanes]]
+            self.mem[lanes, addrs] = values
+            self.input_pos[lanes] += 1
+            self.pc[lanes] = pc + 2
+            return
+
+        a = param(0)
+        if opc == 4:
+            for lane, value in zip(lanes.tolist(), a.tolist()):
+                self.outputs[lane].append(value)
+            self.pc[lanes] = pc + 2
+            return
+        if opc == 9:
+            self.rel_base[lanes] += a
+            self.pc[lanes] = pc + 2
+            return
+
+        b = param(1)
+        if opc == 5:
+            self.pc[lanes] = np.where(a != 0, b, pc + 3)
+            return
+        if opc == 6:
+            self.pc[lanes] = np.where(a == 0, b, pc + 3)
+            return
+
+        c = address(2)
+        if opc == 1 or opc == 2:
+            value = a + b if opc == 1 else a * b
+            wrapped = overflowed(opc, a, b, value)
+            if wrapped.any():
+                self.detach(lanes[wrapped])
+                keep = ~wrapped
+                lanes, c, value = lanes[keep], c[keep], value[keep]
+        elif opc == 7:
+            value = (a < b).astype(np.int64)
+        else:
+            value = (a == b).astype(np.int64)
+        self.mem[lanes, c] = value
+        self.pc[lanes] = pc + 4
+
+    def detach(self, lanes: np.ndarray) -> None:
+        """Moves lanes to scalar VMs, which continue them from their pc."""
+        for lane in lanes.tolist():
+            self.scalar[lane] = self.scalar_vm(lane)
+            self.resume(lane)
+
+    def scalar_vm(self, lane: int) -> Intcode:
+        """Returns a scalar VM in the state of a lane.
+
+        It reads the inputs that the lane hasn't read yet.
+        """
+        vm = Intcode(self.mem[lane].tolist())
+        vm.pc = int(self.pc[lane])
+        vm.rel_base = int(self.rel_base[lane])
+        vm.halted = bool(self.halted[lane])
+        start, end = self.input_pos[lane], self.input_len[lane]
+        vm.inputs = iter(self.input_buf[lane, start:end].tolist())
+        return vm
+
+    def resume(self, lane: int) -> None:
+        """Runs a scalar lane until it halts or needs more input."""
+        vm = self.scalar[lane]
+        self.outputs[lane].extend(vm.run())
+        self.halted[lane] = vm.halted
+        self.waiting[lane] = not vm.halted
+
+
+def fits(values: Iterable[int]) -> bool:
+    """Whether all of `values` fit in 64-bit integers."""
+    return all(-(1 << 63) <= value < 1 << 63 for value in values)
+
+
+def overflowed(opc: int, a: np.ndarray, b: np.ndarray,
+               value: np.ndarray) -> np.ndarray:
+    """Lanes of an addition or multiplication that wrapped to `value`."""
+    if opc == 1:
+        # The sum has the opposite sign of both operands.
+        return ((a ^ value) & (b ^ value)) < 0
+    # Products this far from the limit in floating point are exact, only check
+    # the others.
+    wrapped = np.abs(a.astype(np.float64) * b) >= 2.0 ** 62
+    for i in np.flatnonzero(wrapped).tolist():
+        wrapped[i] = not -2 ** 63 <= int(a[i]) * int(b[i]) < 2 ** 63
+    return wrapped
+
+
+def run_lanes(prog: Program,
+              batch: Sequence[Sequence[int]]) -> List[List[int]]:
+    """Like `run_batch`, but runs all input sequences in lock-step."""
+    return VectorIntcode(prog, len(batch), batch).run()
+
+
+@pytest.mark.parametrize(
+    'prog_str', [
+        '3,9,8,9,10,9,4,9,99,-1,8',
+        '3,3,1107,-1,8,3,4,3,99',
+        '3,12,6,12,15,1,13,14,13,4,13,99,-1,0,1,9',
+        '3,3,1105,-1,9,1101,0,0,12,4,12,99,1',
+        # Counts down from its input, outputting every number on the way.
+        '3,100,4,100,1001,100,-1,100,1005,100,2,99',
+        # Stores its second input past the end of memory, at an address given
+        # by the first.
+        '3,3,109,0,203,0,204,0,99',
+    ]
+)
+def test_run_lanes(prog_str: str) -> None:
+    prog = str_to_prog(prog_str)
+    batch = [[x, x + 1] for x in range(1, 2000, 97)]
+    expected = [Intcode(prog, inputs).run() for inputs in batch]
+    assert run_lanes(prog, batch) == expected
+
+
+def test_self_modifying_lanes() -> None:
+    # The input is written over the opcode at 2, turning it into an addition or
+    # multiplication.
+    prog = str_to_prog('3,2,0,0,0,5,4,5,99')
+    batch = [[1], [2], [1102]]
+    expected = [Intcode(prog, inputs).run() for inputs in batch]
+    assert run_lanes(prog, batch) == expected
+
+
+def test_overflow_falls_back_to_scalar() -> None:
+    # Squares 2 ** 32, and then adds the largest 64-bit integer to its input.
+    prog = str_to_prog('1102,4294967296,4294967296,7,4,7,99,0')
+    assert run_lanes(prog, [[], []]) == [[1 << 64]] * 2
+    prog = str_to_prog('3,100,1001,100,{},100,4,100,99'.format((1 << 63) - 1))
+    batch = [[-5], [1], [0], [-(1 << 63)], [7]]
+    intc = VectorIntcode(prog, len(batch), batch)
+    assert intc.run() == [Intcode(prog, inputs).run() for inputs in batch]
+    assert sorted(intc.scalar) == [1, 4]
+
+
+def test_feed_scalar_lane() -> None:
+    # Outputs the running product of its inputs, starting from 2 ** 40.
+    prog = str_to_prog('1101,0,{},100,3,101,2,100,101,100,4,100,1105,1,4'
+                       .format(1 << 40))
+    intc = VectorIntcode(prog, 2, [[3], [1 << 30]])
+    assert intc.run() == [[3 << 40], [1 << 70]]
+    assert list(intc.scalar) == [1] and intc.waiting.all()
+    intc.feed([[2], [2]])
+    assert intc.run() == [[3 << 40, 3 << 41], [1 << 70, 1 << 71]]
+
+
+def test_feed() -> None:
+    # Outputs the running sum of its inputs.
+    prog = str_to_prog('3,100,1,100,101,101,4,101,1105,1,0')
+    intc = VectorIntcode(prog, 3, [[1], [], [1, 2]])
+    assert intc.run() == [[1], [], [1, 3]]
+    assert intc.waiting.all()
+    intc.feed([[10], [20], []])
+    assert intc.run() == [[1, 11], [20], [1, 3]]
+
+
+def test_values_too_large_for_lanes() -> None:
+    # Outputs the sum of its two inputs.
+    prog = str_to_prog('3,100,3,101,1,100,101,102,4,102,99')
+    intc = VectorIntcode(prog, 3, [[1], [2], [3]])
+    assert intc.run() == [[], [], []]
+    intc.feed([[1 << 70], [2], [-(1 << 63)]])
+    assert list(intc.scalar) == [0]
+    assert intc.run() == [[1 + (1 << 70)], [4], [3 - (1 << 63)]]
+
+    prog = str_to_prog('1101,{},0,0,4,0,99'.format(1 << 64))
+    intc = VectorIntcode(prog, 2)
+    assert intc.run() == [[1 << 64]] * 2
+    assert intc.memory(1)[0] == 1 << 64
+
+
+def test_far_addresses_go_scalar() -> None:
+    # Stores its second input at the address given by its first, and outputs it
+    # from there.
+    prog = str_to_prog('3,3,109,0,203,0,204,0,99')
+    intc = VectorIntcode(prog, 2, [[20, 5], [10 ** 9, 6]])
+    assert intc.run() == [[5], [6]]
+    assert list(intc.scalar) == [1]
+    assert intc.memory(0)[20] == 5 and intc.scalar[1].sparse == {10 ** 9: 6}
+    with pytest.raises(IndexError):
+        VectorIntcode(prog, 1, [[-1, 7]]).run()
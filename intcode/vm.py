@@ -0,0 +1,611 @@
+import sys
+import time
+from enum import Enum
+from itertools import tee
+from typing import List, Dict, Iterable, Generator, Optional, Tuple, cast
+
+import pytest
+
+from . import cache
+from .dispatch import interpret, suspend
+
+Program = List[int]
+
+# Number of parameters per opcode.
+ARITY = {1: 3, 2: 3, 3: 1, 4: 1, 5: 2, 6: 2, 7: 3, 8: 3, 9: 1, 99: 0}
+
+# Mnemonics, for reports and disassembly.
+OPCODE_NAMES = {
+    1: 'add', 2: 'mul', 3: 'in', 4: 'out', 5: 'jnz', 6: 'jz', 7: 'lt',
+    8: 'eq', 9: 'arb', 99: 'halt',
+}
+
+# Dense memory grows in pages of this many words.
+PAGE_SIZE = 1024
+
+# Addresses further than this past the end of dense memory are kept in the
+# sparse memory.
+MAX_DENSE_GROWTH = 64 * PAGE_SIZE
+
+# Instructions run between checks of the deadline given to `run_for`.
+DEADLINE_SLICE = 10000
+
+
+class Status(Enum):
+    """Why `Intcode.run_for` returned."""
+    HALTED = 'halted'
+    NEEDS_INPUT = 'needs-input'
+    OUTPUT_READY = 'output-ready'
+    BUDGET_EXHAUSTED = 'budget-exhausted'
+
+
+def str_to_prog(s: str) -> Program:
+    """Parses a program, through the cache in `cache.CACHE_DIR` if large."""
+    if len(s) < cache.MIN_CACHED_SIZE or not cache.CACHE_DIR:
+        return list(map(int, s.strip().split(',')))
+    key = cache.cache_key(s)
+    prog = cache.load_words(key, 'prog')
+    if prog is None:
+        prog = list(map(int, s.strip().split(',')))
+        cache.save_words(key, 'prog', prog)
+    return prog
+
+
+def values(outputs: List[Optional[int]]) -> List[int]:
+    """Outputs of a run without `yield_on_input`, which are all values."""
+    return cast(List[int], outputs)
+
+
+class Intcode:
+    """Intcode VM.
+
+    Memory is a dense list, starting out as a copy of the program and growing a
+    page at a time when the program goes past its end. Addresses far beyond the
+    end are kept in the `sparse` dict instead, and instructions using them are
+    executed by the slower `step`.
+    """
+    prog: Program
+    sparse: Dict[int, int]
+    peak_memory: int
+    pc: int
+    rel_base: int
+    output: int
+    halted: bool
+    instructions: int
+
+    def __init__(self, prog: Program, inputs: Iterable[int] = ()):
+        self.prog = prog[:]
+        self.sparse = {}
+        self.peak_memory = len(self.prog)
+        self.pc = 0
+        self.rel_base = 0
+        self.inputs = iter(inputs)
+        self.output = 0
+        self.halted = False
+        self.instructions = 0
+
+    @property
+    def needs_input(self) -> bool:
+        """Whether the VM stopped because it ran out of input."""
+        return not self.halted and self.load(self.pc) % 100 == 3
+
+    @property
+    def memory_size(self) -> int:
+        """Number of memory words currently allocated."""
+        return len(self.prog) + len(self.sparse)
+
+    def extend(self, size: int) -> None:
+        """Grows dense memory to at least `size` words."""
+        prog = self.prog
+        size = -(-size // PAGE_SIZE) * PAGE_SIZE
+        start = len(prog)
+        prog.extend([0] * (size - start))
+
+        sparse = self.sparse
+        for addr in [addr for addr in sparse if addr < size]:
+            prog[addr] = sparse.pop(addr)
+        self.peak_memory = max(self.peak_memory, self.memory_size)
+
+    def load(self, addr: int) -> int:
+        if addr < 0:
+            raise IndexError('negative address {}'.format(addr))
+        if addr < len(self.prog):
+            return self.prog[addr]
+        return self.sparse.get(addr, 0)
+
+    def store(self, addr: int, value: int) -> None:
+        if addr < 0:
+            raise IndexError('negative address {}'.format(addr))
+        prog = self.prog
+        if addr >= len(prog) and addr - len(prog) < MAX_DENSE_GROWTH:
+            self.extend(addr + 1)
+        if addr < len(prog):
+            prog[addr] = value
+            self.written(addr)
+        else:
+            self.sparse[addr] = value
+            self.peak_memory = max(self.peak_memory, self.memory_size)
+
+    def written(self, addr: int) -> None:
+        """Called when the slow path writes to dense memory.
+
+        For subclasses caching code.
+        """
+
+    def promote(self) -> None:
+        """Called when a value doesn't fit in memory.
+
+        For subclasses with typed memory.
+        """
+
+    def fault(self, pc: int, rel_base: int) -> Tuple[int, int, Optional[int]]:
+        """Handles an instruction that goes past the end of dense memory.
+
+        Either grows dense memory so that the instruction can be retried, or
+        executes it with `step`. Returns the pc and relative base to continue
+        with, and the output if an output instruction was executed.
+        """
+        prog = self.prog
+        # Instructions themselves always live in dense memory, which only grows
+        # so far.
+        if pc >= len(prog):
+            if pc - len(prog) >= MAX_DENSE_GROWTH:
+                raise IndexError('jump to far address {}'.format(pc))
+            self.extend(pc + 1)
+        arity = ARITY.get(prog[pc] % 100, 0)
+        if pc + arity >= len(prog):
+            self.extend(pc + arity + 1)
+            return pc, rel_base, None
+
+        instr = prog[pc]
+        needed = 0
+        spec = instr // 100
+        for i in range(1, arity + 1):
+            mode = spec % 10
+            if mode == 0:
+                needed = max(needed, prog[pc + i] + 1)
+            elif mode == 2:
+                needed = max(needed, prog[pc + i] + rel_base + 1)
+            spec //= 10
+
+        if needed <= len(prog):
+            raise IndexError('invalid memory access at {}'.format(pc))
+        if needed - len(prog) <= MAX_DENSE_GROWTH:
+            self.extend(needed)
+            return pc, rel_base, None
+        return self.step(pc, rel_base)
+
+    def step(self, pc: int, rel_base: int) -> Tuple[int, int, Optional[int]]:
+        """Executes one instruction, other than input, with `load`/`store`."""
+        self.instructions += 1
+        instr = self.load(pc)
+        opc = instr % 100
+        if opc not in ARITY or opc == 3 or opc == 99:
+            raise ValueError('cannot step opcode {} at {}'.format(opc, pc))
+
+        params = []
+        spec = instr // 100
+        for i in range(1, ARITY[opc] + 1):
+            mode = spec % 10
+            param = self.load(pc + i)
+            if mode == 2:
+                param += rel_base
+            # The third parameter is always a write address, which isn't
+            # dereferenced.
+            if mode != 1 and i != 3:
+                param = self.load(param)
+            params.append(param)
+            spec //= 10
+
+        nxt = pc + ARITY[opc] + 1
+        if opc == 4:
+            self.output = params[0]
+            return nxt, rel_base, params[0]
+        if opc == 9:
+            return nxt, rel_base + params[0], None
+        if opc == 5:
+            return (params[1] if params[0] else nxt), rel_base, None
+        if opc == 6:
+            return (params[1] if not params[0] else nxt), rel_base, None
+
+        a, b, c = params
+        if opc == 1:
+            self.store(c, a + b)
+        elif opc == 2:
+            self.store(c, a * b)
+        elif opc == 7:
+            self.store(c, 1 if a < b else 0)
+        else:
+            self.store(c, 1 if a == b else 0)
+        return nxt, rel_base, None
+
+    def fork(self, inputs: Optional[Iterable[int]] = None) -> 'Intcode':
+        """Returns an independent copy of the VM, continuing from its state.
+
+        The copy reads `inputs` if given, otherwise both VMs get the inputs
+        that haven't been read yet. Should not be called while the VM is
+        running.
+        """
+        clone = object.__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        self.copy_state(clone)
+        if inputs is None:
+            self.inputs, clone.inputs = tee(self.inputs)
+        else:
+            clone.inputs = iter(inputs)
+        return clone
+
+    def copy_state(self, clone: 'Intcode') -> None:
+        """Gives a fork its own copy of the state it would otherwise share.
+
+        `fork` starts out with a shallow copy of every attribute, so subclasses
+        keeping mutable state of their own extend this to copy it as well.
+        """
+        clone.prog = self.prog[:]
+        clone.sparse = dict(self.sparse)
+
+    def snapshot(self) -> 'Snapshot':
+        return Snapshot(self)
+
+    def run(self) -> List[int]:
+        return [output for output in self.execute() if output is not None]
+
+    def feed(self, inputs: Iterable[int], num_outputs: Optional[int] = None):
+        """Replaces the input stream and runs until the next output.
+
+        With `num_outputs`, a list of up to that many outputs is returned
+        instead.
+        """
+        self.inputs = iter(inputs)
+        if num_outputs is None:
+            outputs = self.execute(1)
+            return outputs[0] if outputs else None
+        return self.execute(num_outputs) if num_outputs else []
+
+    def take(self, n: int) -> Tuple[int, ...]:
+        """Runs until the program has output `n` more values, and returns them.
+
+        Fewer are returned if the program halts or needs input first, none if
+        it already has. Unlike `iterable`, this runs without suspending a
+        generator for every output.
+        """
+        return tuple(values(self.execute(n)))
+
+    def has_output(self) -> bool:
+        return bool(self.execute(1))
+
+    def run_until_output(self) -> Generator[Optional[int], None, None]:
+        return self.iterable()
+
+    def iterable(self, yield_on_input: bool = False
+                 ) -> Generator[Optional[int], None, None]:
+        """Runs the program, yielding every output.
+
+        With `yield_on_input`, None is also yielded after every consumed input.
+        The generator stops when the program halts, or when it needs input and
+        `inputs` is exhausted, in which case `pc` is left on the input
+        instruction so a later call can resume it.
+        """
+        while True:
+            outputs = self.execute(1, yield_on_input)
+            if not outputs:
+                return
+            yield outputs[0]
+
+    def run_for(self, budget: Optional[int] = None,
+                deadline: Optional[float] = None,
+                max_outputs: Optional[int] = None,
+                yield_on_input: bool = False
+                ) -> Tuple[Status, List[Optional[int]]]:
+        """Runs the program like `execute`, and returns why it stopped.
+
+        The outputs are returned along with the reason.
+
+        Besides an instruction `budget`, a `deadline` in `time.monotonic`
+        seconds can be given. It is checked every `DEADLINE_SLICE`
+        instructions, and running past it counts as exhausting the budget as
+        well.
+
+        A VM that is left waiting for input it doesn't have is reported as
+        needing input, even when the budget ran out on the way there. When the
+        budget runs out at an input that is there, the VM runs on up to its
+        next jump to find out.
+        """
+        start = self.instructions
+        outputs: List[Optional[int]] = []
+        while True:
+            left = None if max_outputs is None else max_outputs - len(outputs)
+            chunk = None
+            if budget is not None:
+                chunk = start + budget - self.instructions
+            if deadline is not None:
+                chunk = (DEADLINE_SLICE if chunk is None
+                         else min(chunk, DEADLINE_SLICE))
+
+            before = self.instructions
+            outputs += self.execute(left, yield_on_input, chunk)
+            ran = self.instructions - before
+            if (chunk is not None and ran >= chunk and
+                    len(outputs) != max_outputs and self.needs_input):
+                # The budget ran out just as the VM got to an input, which it
+                # may not have. Without input, running it on executes nothing.
+                if max_outputs is not None:
+                    left = max_outputs - len(outputs)
+                before = self.instructions
+                outputs += self.execute(left, yield_on_input, 0)
+                if self.instructions == before:
+                    ran = 0
+
+            if self.halted:
+                return Status.HALTED, outputs
+            if len(outputs) == max_outputs:
+                return Status.OUTPUT_READY, outputs
+            if chunk is None or ran < chunk:
+                return Status.NEEDS_INPUT, outputs
+            if budget is not None and self.instructions - start >= budget:
+                return Status.BUDGET_EXHAUSTED, outputs
+            if deadline is not None and time.monotonic() >= deadline:
+                return Status.BUDGET_EXHAUSTED, outputs
+
+    def execute(self, max_outputs: Optional[int] = None,
+                yield_on_input: bool = False,
+                budget: Optional[int] = None) -> List[Optional[int]]:
+        """Runs the program until it has output `max_outputs` values.
+
+        Returns the outputs.
+
+        Stops early when the program halts, or when it needs input and `inputs`
+        is exhausted. With `yield_on_input`, a None is added to the outputs for
+        every consumed input, and counts towards `max_outputs`. This is the
+        dispatch loop every other way of running the VM goes through, and
+        backends override it.
+
+        With `budget`, it also stops once that many instructions have been
+        executed. That's only checked at jumps, so the program may run a few
+        instructions further, up to the next jump. Every loop has one, so even
+        a program that never stops returns in time.
+
+        Executed instructions are counted in `instructions`, which is kept up
+        to date whenever this returns.
+        """
+        prog = self.prog
+        pc = self.pc
+        rel_base = self.rel_base
+        executed = self.instructions
+        outputs: List[Optional[int]] = []
+        limit = sys.maxsize if budget is None else executed + budget
+
+        while True:
+            executed += 1
+            try:
+                instr = prog[pc]
+                opc = instr % 100
+
+                if opc == 3 or opc == 99:
+                    state = interpret(self, pc, rel_base, executed, outputs,
+                                      max_outputs, yield_on_input)
+                    if state is None:
+                        return outputs
+                    pc, rel_base, executed = state
+                    prog = self.prog
+                    continue
+
+                # Every other instruction has at least one parameter.
+                mode = instr // 100 % 10
+                a = prog[pc + 1]
+                if mode == 0:
+                    a = prog[a]
+                elif mode == 2:
+                    a = prog[rel_base + a]
+
+                if opc == 4:
+                    pc += 2
+                    self.output = a
+                    outputs.append(a)
+                    if len(outputs) == max_outputs:
+                        return suspend(self, pc, rel_base, executed, outputs)
+                    continue
+
+                if opc == 9:
+                    rel_base += a
+                    pc += 2
+                    continue
+
+                mode = instr // 1000 % 10
+                b = prog[pc + 2]
+                if mode == 0:
+                    b = prog[b]
+                elif mode == 2:
+                    b = prog[rel_base + b]
+
+                if opc == 5:
+                    pc = b if a else pc + 3
+                    if executed >= limit:
+                        break
+                    continue
+                if opc == 6:
+                    pc = b if not a else pc + 3
+                    if executed >= limit:
+                        break
+                    continue
+
+                c = prog[pc + 3]
+                if instr // 10000 % 10 == 2:
+                    c += rel_base
+
+                if opc == 1:
+                    prog[c] = a + b
+                elif opc == 2:
+                    prog[c] = a * b
+                elif opc == 7:
+                    prog[c] = 1 if a < b else 0
+                elif opc == 8:
+                    prog[c] = 1 if a == b else 0
+                else:
+                    raise ValueError('unknown opcode {} at {}'.format(opc, pc))
+                pc += 4
+            except IndexError:
+                state = interpret(self, pc, rel_base, executed, outputs,
+                                  max_outputs, yield_on_input, fault=True)
+                if state is None:
+                    return outputs
+                pc, rel_base, executed = state
+                prog = self.prog
+            except OverflowError:
+                # Only typed memory overflows. The instruction is retried once
+                # memory holds Python ints.
+                self.instructions = executed - 1
+                self.promote()
+                prog = self.prog
+                executed = self.instructions
+
+        # Out of budget, which is only checked at jumps.
+        return suspend(self, pc, rel_base, executed, outputs)
+
+
+class Snapshot:
+    """Frozen state of a VM, which any number of VMs can be forked from.
+
+    Forks start out with a copy of the snapshot's memory and of whatever the
+    backend has cached about the code, so running them doesn't repeat any of
+    the work done before the snapshot was taken. The inputs the VM hadn't read
+    yet are kept too, and every fork reads them unless it's given inputs of its
+    own.
+    """
+    vm: Intcode
+
+    def __init__(self, vm: Intcode):
+        self.vm = vm.fork()
+
+    def fork(self, inputs: Optional[Iterable[int]] = None) -> Intcode:
+        return self.vm.fork(inputs)
+
+
+def test_resume_after_exhausted_input() -> None:
+    intc = Intcode(str_to_prog('3,0,4,0,3,0,4,0,99'))
+    assert intc.feed([]) is None
+    assert not intc.halted
+    assert intc.feed([5]) == 5
+    assert intc.feed([6], 2) == [6]
+    assert intc.halted
+
+
+def test_memory_grows_past_program() -> None:
+    intc = Intcode(str_to_prog('3,100,4,100,1101,1,2,2000,4,2000,99'))
+    assert intc.feed([7], 2) == [7, 3]
+    assert len(intc.prog) == 2 * PAGE_SIZE
+    assert intc.peak_memory == 2 * PAGE_SIZE
+
+    # Far addresses don't grow dense memory.
+    intc = Intcode(str_to_prog('1101,1,2,1000000000,99'))
+    intc.run()
+    assert len(intc.prog) == 5 and intc.peak_memory == 6
+
+    # Neither do jumps to them.
+    intc = Intcode(str_to_prog('1105,1,1000000000'))
+    with pytest.raises(IndexError):
+        intc.run()
+    assert len(intc.prog) == 3
+
+
+def test_instructions() -> None:
+    prog = str_to_prog('3,100,4,100,1105,1,0')
+    intc = Intcode(prog, [1, 2])
+    assert intc.run() == [1, 2]
+    assert intc.needs_input
+    # Two loops of three instructions, and nothing for the input it ran out at.
+    assert intc.instructions == 6
+
+    prog = str_to_prog(
+        '3,1000000000,109,999999990,22201,10,10,11,204,11,4,0,99')
+    intc = Intcode(prog, [2])
+    assert intc.run() == [4, 3]
+    assert not intc.needs_input and intc.instructions == 6
+
+
+def test_take() -> None:
+    # Outputs every input together with its double.
+    prog = str_to_prog('3,100,4,100,1002,100,2,100,4,100,1105,1,0')
+    intc = Intcode(prog, [1, 2, 3])
+    assert intc.take(2) == (1, 2)
+    assert intc.take(3) == (2, 4, 3)
+    assert intc.take(3) == (6,)
+    assert intc.needs_input and intc.take(1) == ()
+    assert intc.instructions == 15
+
+
+def test_run_for() -> None:
+    intc = Intcode(str_to_prog('3,100,4,100,1105,1,0'), [1, 2])
+    assert intc.run_for(max_outputs=1) == (Status.OUTPUT_READY, [1])
+    # The budget runs out in the middle of the loop, and is checked at the jump
+    # ending it, which goes back to an input the VM has none left for.
+    assert intc.run_for(2) == (Status.NEEDS_INPUT, [2])
+    assert intc.instructions == 6
+    assert intc.run_for(100) == (Status.NEEDS_INPUT, [])
+    intc = Intcode(str_to_prog('104,5,99'))
+    assert intc.run_for(100) == (Status.HALTED, [5])
+
+    # The budget runs out at the input, which only blocks once there is none
+    # left.
+    prog = str_to_prog('1101,0,0,100,1101,0,0,100,1101,0,0,100,'
+                       '3,100,4,100,1105,1,12')
+    intc = Intcode(prog)
+    assert intc.run_for(2) == (Status.NEEDS_INPUT, [])
+    assert intc.needs_input and intc.instructions == 3
+    # With input, it runs on to the next jump instead.
+    intc = Intcode(prog, [7, 8])
+    assert intc.run_for(2) == (Status.BUDGET_EXHAUSTED, [7, 8])
+    assert intc.instructions == 9
+    assert intc.run_for(2) == (Status.NEEDS_INPUT, [])
+
+    intc = Intcode(str_to_prog('1105,1,0'))
+    assert intc.run_for(deadline=time.monotonic()) == \
+        (Status.BUDGET_EXHAUSTED, [])
+    assert intc.instructions == DEADLINE_SLICE
+
+
+def test_fork() -> None:
+    # Outputs the sum of every pair of inputs.
+    prog = str_to_prog('3,100,3,101,1,100,101,102,4,102,1105,1,0')
+    intc = Intcode(prog)
+    assert intc.feed([1, 2]) == 3
+    clone = intc.fork([5, 6])
+    assert intc.feed([3, 4]) == 7
+    assert next(clone.iterable()) == 11
+
+    snapshot = intc.snapshot()
+    assert intc.feed([10, 20]) == 30
+    forks = [snapshot.fork([x, 1]) for x in range(3)]
+    assert [next(fork.iterable()) for fork in forks] == [1, 2, 3]
+
+
+def test_snapshot_keeps_pending_inputs() -> None:
+    intc = Intcode(str_to_prog('3,100,4,100,1105,1,0'), [1, 2, 3])
+    assert next(intc.iterable()) == 1
+    snapshot = intc.snapshot()
+    assert intc.run() == [2, 3]
+    assert snapshot.fork().run() == snapshot.fork().run() == [2, 3]
+    assert snapshot.fork([4]).run() == [4]
+
+
+def test_fork_shares_pending_inputs() -> None:
+    intc = Intcode(str_to_prog('3,100,4,100,1105,1,0'), [1, 2, 3])
+    assert next(intc.iterable()) == 1
+    clone = intc.fork()
+    assert intc.run() == clone.run() == [2, 3]
+
+
+def test_str_to_prog_cache(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(cache, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(cache, 'MIN_CACHED_SIZE', 0)
+    prog_str = '104,1125899906842624,99\n'
+    assert str_to_prog(prog_str) == str_to_prog(prog_str) == \
+        [104, 1125899906842624, 99]
+    assert len(list(tmp_path.iterdir())) == 1
+    # Too large for the cache, so it's parsed every time.
+    assert str_to_prog('104,{},99'.format(1 << 70)) == [104, 1 << 70, 99]
+    assert len(list(tmp_path.iterdir())) == 1
+    # Entries of another format version are never read.
+    monkeypatch.setattr(cache, 'FORMAT_VERSION', cache.FORMAT_VERSION + 1)
+    assert str_to_prog(prog_str) == [104, 1125899906842624, 99]
+    assert len(list(tmp_path.iterdir())) == 2